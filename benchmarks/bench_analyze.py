@@ -0,0 +1,63 @@
+"""Compare analyze_message against the separate regex scans it replaced
+
+Usage: python benchmarks/bench_analyze.py [-n 200]
+
+The code blocks, language tags, links and keyword text of every message
+of a synthetic export and of a few hand-written edge cases are computed
+both ways. Reports the time of each and the messages whose results differ.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import json2md  # noqa: E402
+import synthetic_export  # noqa: E402
+
+EDGE_CASES = [
+    "Use ``` to start a block.\n\n```python\nprint(1)\n```\n",
+    "```\nno language\n```\n\n```js\nconsole.log(1)\n```",
+    "```python\nunterminated block",
+    "text ```inline``` and ```sql\nSELECT 1;\n``` [link](https://example.com/a) https://example.com/b",
+    "```markdown\n```js\nnested\n```\n```\n",
+    "````python\nfour backticks\n````\n",
+    "[in code](https://example.com)\n```\n[link](https://example.com/c)\n```",
+]
+
+def separate_scans(text):
+    """The per-consumer regexes used before analyze_message"""
+    code_blocks = [(m.group(1), len(m.group(2))) for m in re.finditer(r'```(\w*)\n(.*?)```', text, re.DOTALL)]
+    languages = [m.group(1) for m in re.finditer(r'```(\w*)\n', text)]
+    links = re.findall(r'\[([^\]]+)\]\(([^)]+)\)', text)
+    plain_text = re.sub(r'https?://[\w/:%#\$&\?\(\)~\.=\+\-]+', '', re.sub(r'```[\s\S]*?```', '', text))
+    return code_blocks, languages, links, plain_text
+
+def single_analysis(text):
+    analysis = json2md.analyze_message(text)
+    return analysis.code_blocks, analysis.languages, analysis.links, analysis.plain_text
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and check the message analysis')
+    synthetic_export.add_arguments(parser)
+    args = parser.parse_args()
+    texts = [node['message']['content']['parts'][0]
+             for conversation in synthetic_export.from_arguments(args)
+             for node in conversation['mapping'].values() if node['message']]
+    texts += EDGE_CASES
+
+    results = {}
+    for name, analyze in (('separate scans', separate_scans), ('analyze_message', single_analysis)):
+        start = time.perf_counter()
+        results[name] = [analyze(text) for text in texts]
+        print(f"{name:<16} {time.perf_counter() - start:8.3f} s  ({len(texts)} messages)")
+    different = [text for text, a, b in zip(texts, results['separate scans'], results['analyze_message']) if a != b]
+    print(f"different results: {len(different)}")
+    for text in different:
+        print(f"  {text[:60]!r}")
+    sys.exit(1 if different else 0)
+
+if __name__ == '__main__':
+    main()
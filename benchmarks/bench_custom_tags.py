@@ -0,0 +1,67 @@
+"""Compare custom tag matching: per-tag substring scans vs. CustomTagMatcher
+
+Usage: python benchmarks/bench_custom_tags.py [messages]
+
+Prints the time to tag the same messages as the number of custom tags grows.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import json2md  # noqa: E402
+
+WORDS = ['python', 'error', 'function', 'データベース', 'query', 'index', 'class', '設定', 'browser',
+         'exception', 'import', 'solution', '形態素解析', 'table', 'variable', 'deploy', 'server']
+
+def make_custom_tags(count, conditions_per_tag=8, rng=None):
+    rng = rng or random.Random(0)
+    tags = {}
+    for i in range(count):
+        tags[f'tag{i}'] = [f"{rng.choice(WORDS)}{rng.randint(0, count * 4)}" for _ in range(conditions_per_tag)]
+    return tags
+
+def make_messages(count, length=2000, rng=None):
+    rng = rng or random.Random(1)
+    messages = []
+    for _ in range(count):
+        text = []
+        while sum(len(w) + 1 for w in text) < length:
+            word = rng.choice(WORDS)
+            if rng.random() < 0.3:
+                word += str(rng.randint(0, 2000))
+            text.append(word)
+        messages.append({'role': 'assistant', 'text': ' '.join(text)})
+    return messages
+
+def naive_tags(messages, custom_tags):
+    # 変更前の実装（タグ×メッセージ×条件ごとに部分文字列を検索）
+    tags = set()
+    for tag, conditions in custom_tags.items():
+        for msg in messages:
+            if any(condition.lower() in msg['text'].lower() for condition in conditions):
+                tags.add(tag)
+    return tags
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main():
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    messages = make_messages(message_count)
+    print(f"{message_count} messages, 8 conditions per tag")
+    print(f"{'tags':>6} {'naive [s]':>10} {'build [s]':>10} {'matcher [s]':>12} {'speedup':>8}")
+    for tag_count in (8, 32, 128, 512, 2048):
+        custom_tags = make_custom_tags(tag_count)
+        expected, naive_time = timed(lambda: naive_tags(messages, custom_tags))
+        matcher, build_time = timed(lambda: json2md.CustomTagMatcher(custom_tags))
+        result, match_time = timed(lambda: matcher.match(msg['text'] for msg in messages))
+        assert result == expected
+        print(f"{tag_count:>6} {naive_time:>10.3f} {build_time:>10.3f} {match_time:>12.3f} "
+              f"{naive_time / match_time:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Compare peak memory of the streaming loader against json.load
+
+Usage: python benchmarks/bench_memory.py [conversations.json]
+
+Without an argument a synthetic export is generated in a temporary directory.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import json2md  # noqa: E402
+import synthetic_export  # noqa: E402
+
+def measure(label, load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for _ in load():
+        count += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {count:>8} conversations  {elapsed:8.2f} s  peak {peak / 1024 / 1024:10.1f} MiB")
+
+def main():
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'conversations.json')
+        synthetic_export.SyntheticExport(conversations=2000, turns=20, paragraphs=8).write(path)
+    print(f"{path}: {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+    measure('json.load', lambda: json2md.load_conversations(path, stream=False))
+    measure('stream', lambda: json2md.load_conversations(path, stream=True))
+
+if __name__ == '__main__':
+    main()
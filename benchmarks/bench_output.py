@@ -0,0 +1,70 @@
+"""Compare the time to write rendered conversations in each output format
+
+Usage: python benchmarks/bench_output.py -n 5000
+
+Conversations of a synthetic export are rendered once (without keyword
+tags), then written as individual files and as each single-file format
+of json2md.OUTPUT_FORMATS into fresh directories.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import json2md  # noqa: E402
+import synthetic_export  # noqa: E402
+
+def write_files(output_dir, rendered, threads):
+    writer = json2md.OutputWriter(output_dir, threads)
+    for filename, markdown in rendered:
+        writer.write(filename, markdown, lambda written: None)
+    writer.close()
+
+def write_single(output_dir, rendered, output_class):
+    output = output_class(output_dir)
+    for filename, markdown in rendered:
+        output.write(filename, markdown)
+    output.close()
+    return output.path
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the output formats')
+    synthetic_export.add_arguments(parser)
+    parser.add_argument('-c', '--config', default='config.json', help='configuration file')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = json2md.load_config(args.config)
+    config['features']['use_keyword_tags'] = False
+    tag_matcher = json2md.build_tag_matcher(config)
+    rendered = [(result.filename, result.markdown) for result
+                in json2md.convert_conversations(synthetic_export.from_arguments(args), config,
+                                                 tag_matcher=tag_matcher)]
+    total = sum(len(markdown.encode('utf-8')) for _, markdown in rendered)
+    print(f"{len(rendered)} conversations, {total / 1024 / 1024:.1f} MiB of Markdown")
+
+    targets = [(f'files (writer threads {threads})', lambda d, t=threads: write_files(d, rendered, t))
+               for threads in (0, json2md.DEFAULT_WRITER_THREADS)]
+    targets += [(name, lambda d, c=output_class: write_single(d, rendered, c))
+                for name, output_class in json2md.OUTPUT_FORMATS.items() if output_class is not None]
+    workdir = tempfile.mkdtemp(prefix='json2md-output-')
+    try:
+        print(f"{'format':<24} {'seconds':>8}")
+        for i, (name, write) in enumerate(targets):
+            output_dir = os.path.join(workdir, str(i))
+            os.makedirs(output_dir)
+            start = time.perf_counter()
+            write(output_dir)
+            print(f"{name:<24} {time.perf_counter() - start:8.3f}")
+            shutil.rmtree(output_dir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Time each stage of the conversion pipeline on a synthetic export
+
+Usage: python benchmarks/bench_pipeline.py -n 500 --results bench_results.json
+
+Each stage runs over all conversations on its own, so the timings add up
+to roughly the cost of a full conversion. The keyword cache is not used.
+Results are written as JSON together with the commit and parameters, so
+runs from different commits can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import json2md  # noqa: E402
+import synthetic_export  # noqa: E402
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class StageTimer:
+    """Collect wall time per stage"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, func, items):
+        """Call func on every item and record the total time under name"""
+        start = time.perf_counter()
+        results = [func(item) for item in items]
+        elapsed = time.perf_counter() - start
+        self.stages[name] = {'seconds': round(elapsed, 6), 'calls': len(items)}
+        print(f"{name:<22} {elapsed:10.3f} s  ({len(items)} calls)")
+        return results
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='json2md-bench-')
+    try:
+        path = os.path.join(workdir, 'conversations.json')
+        synthetic_export.from_arguments(args).write(path)
+        size = os.path.getsize(path)
+        print(f"{args.conversations} conversations, {size / 1024 / 1024:.1f} MiB")
+
+        config = json2md.load_config(args.config)
+        config['keyword_cache']['enabled'] = False
+        timer = StageTimer()
+
+        conversations = timer.run('json_load', lambda p: json2md.load_conversations(p, stream=False), [path])[0]
+        timer.run('json_stream', lambda p: sum(1 for _ in json2md.iter_conversations(p)), [path])
+        all_messages = timer.run('extract_messages',
+                                 lambda c: json2md.conversation_messages(c, config), conversations)
+        flat_messages = [msg for messages in all_messages for msg in messages]
+        timer.run('analyze_message', json2md.message_analysis, flat_messages)
+        timer.run('extract_metadata', json2md.extract_metadata, all_messages)
+
+        extractor = json2md.KeywordExtractor(config, debug=False)
+        extractor.tokenizer  # 辞書の読み込みはキーワード抽出の時間に含めない
+        timer.run('extract_keywords',
+                  lambda messages: [extractor.extract(msg.text, json2md.keyword_title(messages),
+                                                      json2md.message_analysis(msg))
+                                    for msg in messages],
+                  all_messages)
+        matcher = json2md.CustomTagMatcher(config.get('custom_tags', {}))
+        timer.run('custom_tags', lambda messages: matcher.match(msg.text for msg in messages), all_messages)
+
+        rendered = timer.run('convert_to_markdown',
+                             lambda c: json2md.render_conversation(c, config, extractor, matcher), conversations)
+        output_dir = os.path.join(workdir, 'output')
+        os.makedirs(output_dir)
+
+        def write_file(item):
+            filename, markdown, _, _ = item
+            with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+                f.write(markdown)
+        timer.run('write_files', write_file, rendered)
+
+        return {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': {
+                'conversations': args.conversations,
+                'turns': args.turns,
+                'ja_ratio': args.ja_ratio,
+                'code_density': args.code_density,
+                'branching': args.branching,
+                'seed': args.seed,
+            },
+            'input_bytes': size,
+            'messages': len(flat_messages),
+            'stages': timer.stages,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the conversion pipeline stage by stage')
+    synthetic_export.add_arguments(parser)
+    parser.add_argument('-c', '--config', default='config.json', help='configuration file')
+    parser.add_argument('--results', default='bench_results.json', help='JSON file to write the results to')
+    args = parser.parse_args()
+    results = run(args)
+    with open(args.results, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.results}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Compare selecting conversations through the offset index with streaming and filtering
+
+Usage: python benchmarks/bench_select.py [-n 2000] [--select 20]
+
+The synthetic export is written as compact JSON with LF line endings and
+pretty-printed (indent=2) with CRLF line endings. For each file, --select
+conversations are picked by id and read with select_conversations (the
+first run also builds the offset index), and the result is checked
+against streaming the whole export and filtering it. Finally the two
+files and each file with itself are merged with MergedExports, which must
+yield every conversation exactly once.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import json2md  # noqa: E402
+import synthetic_export  # noqa: E402
+
+LAYOUTS = [
+    ('compact, LF', None, '\n'),
+    ('indent=2, CRLF', 2, '\r\n'),
+]
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and check selecting conversations by id')
+    synthetic_export.add_arguments(parser)
+    parser.add_argument('--select', type=int, default=20, help='number of conversations to select')
+    args = parser.parse_args()
+
+    ids = [c['id'] for c in synthetic_export.from_arguments(args)]
+    selection = json2md.ConversationSelection(random.Random(args.seed).sample(ids, min(args.select, len(ids))))
+    workdir = tempfile.mkdtemp(prefix='json2md-select-')
+    failures = 0
+    paths = []
+    try:
+        print(f"{'layout':<16} {'MiB':>7} {'stream [s]':>11} {'index+select [s]':>17} {'select [s]':>11} {'same':>5}")
+        for name, indent, newline in LAYOUTS:
+            path = os.path.join(workdir, f"conversations-{len(newline)}.json")
+            synthetic_export.from_arguments(args).write(path, indent, newline)
+            paths.append(path)
+            expected, stream_time = timed(
+                lambda: [c for c in json2md.iter_conversations(path) if selection.matches_conversation(c)])
+            first, first_time = timed(lambda: list(json2md.select_conversations(path, selection)))
+            second, second_time = timed(lambda: list(json2md.select_conversations(path, selection)))
+            same = first == expected and second == expected
+            failures += not same
+            print(f"{name:<16} {os.path.getsize(path) / 1024 / 1024:7.1f} {stream_time:11.3f} "
+                  f"{first_time:17.3f} {second_time:11.3f} {str(same):>5}")
+
+        expected = list(json2md.iter_conversations(paths[0]))
+        print(f"\n{'merged exports':<32} {'merge+read [s]':>15} {'same':>5}")
+        for name, inputs in [(f"{LAYOUTS[0][0]} + {LAYOUTS[1][0]}", paths)] + [
+                (f"{layout[0]} x 2", [path, path]) for layout, path in zip(LAYOUTS, paths)]:
+            merged, merge_time = timed(lambda: list(json2md.MergedExports(inputs)))
+            same = merged == expected
+            failures += not same
+            print(f"{name:<32} {merge_time:15.3f} {str(same):>5}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
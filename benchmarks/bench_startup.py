@@ -0,0 +1,84 @@
+"""Measure startup cost as the time until the first Markdown file is written
+
+Usage: python benchmarks/bench_startup.py [--exe releases/json2md] [--repeat 5]
+
+Runs json2md.py (and the PyInstaller build from json2md.spec if --exe is
+given) on a tiny synthetic export with the keyword cache disabled, so the
+time until the first "Created:" line is mostly interpreter and dictionary
+startup. Keyword tags on/off and the janome dictionary mode (mmap or RAM)
+are measured separately.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(BENCH_DIR, '..', 'json2md.py')
+sys.path.insert(0, BENCH_DIR)
+import synthetic_export  # noqa: E402
+
+VARIANTS = [
+    ('keyword tags off', {'features': {'use_keyword_tags': False}}),
+    ('keyword tags, mmap', {'tokenizer': {'mmap': True}}),
+    ('keyword tags, RAM dictionary', {'tokenizer': {'mmap': False}}),
+]
+
+def time_to_first_file(command):
+    """Run command and return (seconds until the first file is written, total seconds)"""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')  # "Created:"をすぐに読めるようにする
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env,
+                               text=True, encoding='utf-8', errors='replace')
+    first = None
+    for line in process.stdout:
+        if first is None and line.startswith('Created:'):
+            first = time.perf_counter() - start
+    process.wait()
+    total = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{command[0]} exited with status {process.returncode}")
+    return (first if first is not None else total), total
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='json2md-startup-')
+    try:
+        input_file = os.path.join(workdir, 'conversations.json')
+        synthetic_export.SyntheticExport(conversations=args.conversations, turns=3, seed=0).write(input_file)
+        programs = [('script', [sys.executable, SCRIPT])]
+        if args.exe:
+            programs.append(('frozen', [os.path.abspath(args.exe)]))
+
+        print(f"{'program':<8} {'variant':<30} {'first file [s]':>15} {'total [s]':>10}")
+        for program, command in programs:
+            for name, overrides in VARIANTS:
+                config = dict(overrides, keyword_cache={'enabled': False})
+                config_path = os.path.join(workdir, 'config.json')
+                with open(config_path, 'w', encoding='utf-8') as f:
+                    json.dump(config, f)
+                firsts, totals = [], []
+                for i in range(args.repeat):
+                    output_dir = os.path.join(workdir, f'output-{program}-{i}')
+                    shutil.rmtree(output_dir, ignore_errors=True)
+                    first, total = time_to_first_file(
+                        command + [input_file, '-o', output_dir, '-c', config_path, '--force'])
+                    firsts.append(first)
+                    totals.append(total)
+                print(f"{program:<8} {name:<30} {statistics.median(firsts):15.3f} {statistics.median(totals):10.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure time-to-first-file of json2md')
+    parser.add_argument('--exe', help='PyInstaller build of json2md.spec to measure as well (e.g. releases/json2md)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per variant (the median is reported)')
+    parser.add_argument('-n', '--conversations', type=int, default=3, help='conversations in the export')
+    run(parser.parse_args())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Compare whole-text and chunked tokenization of very large messages
+
+Usage: python benchmarks/bench_tokenize.py [--sizes 10000 50000 200000]
+
+For each message size, extracts keywords once with chunking disabled and
+once with the configured tokenize_chunk_size, and reports the time, the
+tracemalloc peak and whether the keywords are the same. The keyword cache
+is not used.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import json2md  # noqa: E402
+import synthetic_export  # noqa: E402
+
+def make_message(size, seed=0):
+    """Return a message of about size characters without code fences (like a pasted log)"""
+    export = synthetic_export.SyntheticExport(code_density=0.0, seed=seed)
+    paragraphs = []
+    length = 0
+    while length < size:
+        paragraph = export.paragraph()
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return '\n\n'.join(paragraphs)[:size]
+
+def measure(extractor, text):
+    tracemalloc.start()
+    start = time.perf_counter()
+    keywords = extractor.extract(text)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sorted(keywords), elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark chunked tokenization of large messages')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 200000],
+                        help='message sizes in characters')
+    parser.add_argument('-c', '--config', default='config.json', help='configuration file')
+    args = parser.parse_args()
+
+    config = json2md.load_config(args.config)
+    whole = json2md.KeywordExtractor(dict(config, keyword_settings=dict(config['keyword_settings'],
+                                                                        tokenize_chunk_size=0)))
+    chunked = json2md.KeywordExtractor(config)
+    whole.extract(make_message(1000))  # 辞書の読み込みと初回の初期化は計測に含めない
+    print(f"chunk size: {chunked.chunk_size} characters")
+    print(f"{'chars':>8} {'whole [s]':>10} {'peak [MiB]':>11} {'chunked [s]':>12} {'peak [MiB]':>11} {'same':>5}")
+    for size in args.sizes:
+        text = make_message(size)
+        whole_keywords, whole_time, whole_peak = measure(whole, text)
+        chunked_keywords, chunked_time, chunked_peak = measure(chunked, text)
+        print(f"{size:8d} {whole_time:10.3f} {whole_peak / 1024 / 1024:11.1f} "
+              f"{chunked_time:12.3f} {chunked_peak / 1024 / 1024:11.1f} {str(whole_keywords == chunked_keywords):>5}")
+
+if __name__ == '__main__':
+    main()
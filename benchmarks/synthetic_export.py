@@ -0,0 +1,168 @@
+"""Generate a synthetic ChatGPT conversations.json for benchmarks
+
+Usage: python benchmarks/synthetic_export.py -n 1000 -o conversations.json
+
+The export is written one conversation at a time, so large files can be
+generated without holding them in memory. The same arguments and seed
+always produce the same file.
+"""
+import argparse
+import json
+import random
+import uuid
+
+JA_NOUNS = ['形態素解析', 'データベース', 'インデックス', '設定ファイル', '関数', '変数', 'サーバー', 'クライアント',
+            '東京', '天気', '機械学習', 'モデル', '評価指標', 'テスト', 'エラー', 'ログ', 'キャッシュ', 'メモリ',
+            'ファイル', 'ディレクトリ', '文字列', '配列', '辞書', 'ネットワーク', '認証', 'ユーザー', '画面', '料理']
+JA_VERBS = ['を確認します', 'を設定してください', 'が遅いです', 'について教えてください', 'を使います',
+            'が表示されません', 'を保存しました', 'を比較すると分かりやすいです', 'が必要です', 'を追加しました']
+JA_LINKS = ['また', 'そして', 'しかし', 'ただし', 'そのため', '例えば']
+EN_WORDS = ['python', 'function', 'error', 'class', 'variable', 'database', 'query', 'index', 'server', 'client',
+            'cache', 'memory', 'request', 'response', 'deploy', 'config', 'token', 'parser', 'browser', 'network']
+EN_TEMPLATES = ['How do I fix the {0} in my {1}?', 'The {0} is slow when the {1} grows.',
+                'You can use a {0} to speed up the {1}.', 'Check the {0} before calling the {1}.',
+                'This {0} returns a {1} object.', 'Why does the {0} fail with this {1}?']
+CODE_SNIPPETS = {
+    'python': 'import os\n\ndef main():\n    for name in os.listdir("."):\n        print(name)\n',
+    'javascript': 'const items = [1, 2, 3];\nitems.forEach((x) => console.log(x * 2));\n',
+    'sql': 'SELECT id, title FROM conversations WHERE update_time > 0 ORDER BY id;\n',
+    'bash': 'pip install -r requirements.txt\npython json2md.py conversations.json\n',
+    '': 'plain output line 1\nplain output line 2\n',
+}
+URLS = ['https://docs.python.org/3/library/json.html', 'https://example.com/docs?page=2',
+        'https://github.com/mocobeta/janome']
+
+class SyntheticExport:
+    """Generator of synthetic conversations
+
+    conversations: number of conversations
+    turns: average number of user/assistant turns per conversation
+    ja_ratio: probability that a paragraph is Japanese rather than English
+    code_density: probability that a paragraph is a fenced code block
+    branching: probability that a turn has a regenerated (abandoned) sibling
+    """
+
+    def __init__(self, conversations=100, turns=10, ja_ratio=0.5, code_density=0.2, branching=0.1,
+                 paragraphs=4, seed=0):
+        self.conversations = conversations
+        self.turns = turns
+        self.ja_ratio = ja_ratio
+        self.code_density = code_density
+        self.branching = branching
+        self.paragraphs = paragraphs
+        self.rng = random.Random(seed)
+
+    def japanese_sentence(self):
+        rng = self.rng
+        sentence = f"{rng.choice(JA_NOUNS)}の{rng.choice(JA_NOUNS)}{rng.choice(JA_VERBS)}。"
+        if rng.random() < 0.3:
+            sentence = f"{rng.choice(JA_LINKS)}、{sentence}"
+        return sentence
+
+    def english_sentence(self):
+        rng = self.rng
+        return rng.choice(EN_TEMPLATES).format(rng.choice(EN_WORDS), rng.choice(EN_WORDS))
+
+    def paragraph(self):
+        rng = self.rng
+        if rng.random() < self.code_density:
+            language = rng.choice(list(CODE_SNIPPETS))
+            return f"```{language}\n{CODE_SNIPPETS[language] * rng.randint(1, 4)}```"
+        sentence = self.japanese_sentence if rng.random() < self.ja_ratio else self.english_sentence
+        text = ''.join(sentence() for _ in range(rng.randint(1, 5)))
+        if rng.random() < 0.1:
+            text += f" [{rng.choice(EN_WORDS)}]({rng.choice(URLS)})"
+        elif rng.random() < 0.1:
+            text += f" {rng.choice(URLS)}"
+        return text
+
+    def message_text(self, role):
+        count = 1 if role == 'user' else self.rng.randint(1, 2 * self.paragraphs)
+        return '\n\n'.join(self.paragraph() for _ in range(count))
+
+    def node(self, node_id, parent, role, create_time):
+        return {
+            'id': node_id,
+            'parent': parent,
+            'children': [],
+            'message': {
+                'id': node_id,
+                'author': {'role': role},
+                'create_time': create_time,
+                'content': {'content_type': 'text', 'parts': [self.message_text(role)]},
+            },
+        }
+
+    def conversation(self, index):
+        rng = self.rng
+        create_time = 1672531200 + index * 3600 + rng.randint(0, 3000)
+        root_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        mapping = {root_id: {'id': root_id, 'parent': None, 'children': [], 'message': None}}
+        parent = root_id
+        current_time = create_time
+        for turn in range(max(1, int(rng.gauss(self.turns, self.turns / 3)))):
+            for role in ('user', 'assistant'):
+                current_time += rng.randint(5, 300)
+                if rng.random() < self.branching:
+                    # 再生成されて使われなくなった枝
+                    branch_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                    mapping[branch_id] = self.node(branch_id, parent, role, current_time)
+                    mapping[parent]['children'].append(branch_id)
+                    current_time += rng.randint(5, 60)
+                node_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                mapping[node_id] = self.node(node_id, parent, role, current_time)
+                mapping[parent]['children'].append(node_id)
+                parent = node_id
+        title = rng.choice(['', f"{rng.choice(JA_NOUNS)}について", f"{rng.choice(EN_WORDS)} question"])
+        return {
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'title': title,
+            'create_time': create_time,
+            'update_time': current_time,
+            'mapping': mapping,
+            'current_node': parent,
+        }
+
+    def __iter__(self):
+        for index in range(self.conversations):
+            yield self.conversation(index)
+
+    def write(self, path, indent=None, newline='\n'):
+        """Write the export to path and return the number of conversations
+
+        indent pretty-prints each conversation; newline='\\r\\n' writes the
+        file with Windows line endings (as after re-saving it there).
+        """
+        with open(path, 'w', encoding='utf-8', newline=newline) as f:
+            f.write('[')
+            for index, conversation in enumerate(self):
+                if index:
+                    f.write(',\n')
+                json.dump(conversation, f, ensure_ascii=False, indent=indent)
+            f.write(']')
+        return self.conversations
+
+def add_arguments(parser):
+    parser.add_argument('-n', '--conversations', type=int, default=100, help='number of conversations')
+    parser.add_argument('--turns', type=int, default=10, help='average turns per conversation')
+    parser.add_argument('--ja-ratio', type=float, default=0.5, help='share of Japanese paragraphs')
+    parser.add_argument('--code-density', type=float, default=0.2, help='share of code-block paragraphs')
+    parser.add_argument('--branching', type=float, default=0.1, help='probability of a regenerated branch per turn')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+def from_arguments(args):
+    return SyntheticExport(args.conversations, args.turns, args.ja_ratio, args.code_density,
+                           args.branching, seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic conversations.json')
+    add_arguments(parser)
+    parser.add_argument('-o', '--output', default='conversations.json', help='output file')
+    parser.add_argument('--indent', type=int, help='pretty-print each conversation with this indent')
+    parser.add_argument('--crlf', action='store_true', help='write Windows line endings')
+    args = parser.parse_args()
+    count = from_arguments(args).write(args.output, args.indent, '\r\n' if args.crlf else '\n')
+    print(f"Wrote {count} conversations to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,28 @@
+import argparse
+from array import array
+import functools
+import hashlib
+import heapq
+import itertools
+import io
 import json
+import mmap
+import multiprocessing
 import os
 import re
-from datetime import datetime
-from collections import defaultdict
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from collections import defaultdict, deque, namedtuple
+import sqlite3
 import sys
-from janome.tokenizer import Tokenizer
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.parse
+import warnings
+import zipfile
 
 def get_resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -15,9 +33,12 @@ def get_resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-def load_config(config_path='config.json'):
-    """Load configuration with default values"""
-    default_config = {
+# ユーザー設定をデフォルト設定にマージする（上書きではなくupdateする）セクション
+NESTED_CONFIG_KEYS = ['features', 'custom_tags', 'stopwords', 'keyword_settings', 'keyword_cache', 'tokenizer']
+
+def default_config():
+    """Return the default configuration (what load_config uses when there is no config file)"""
+    return {
         "user_name": "mr.774",  # デフォルトユーザー名を設定
         "user_email": "",
         "features": {
@@ -32,13 +53,25 @@ def load_config(config_path='config.json'):
             "show_tags": True,
             "use_language_tags": True,
             "use_keyword_tags": True,
-            "use_custom_tags": True
+            "use_custom_tags": True,
+            "include_all_branches": False  # Trueで再生成前の回答など現在の会話以外の分岐も含める
         },
         "keyword_settings": {
             "min_frequency": 3,  # 最低出現回数
             "max_keywords": 5,   # 最大キーワード数
             "min_length": 2,     # 最小文字数
-            "topK": 50          # キーワード候補の取得数
+            "topK": 50,         # キーワード候補の取得数
+            "mode": "message",  # "message": メッセージごとの出現回数 / "corpus": エクスポート全体でのTF-IDF
+            "corpus_min_df": 2,  # corpusモードで対象とする単語の最小出現会話数
+            "tokenize_chunk_size": 10000  # これより長いテキストは文・段落の区切りで分割して形態素解析
+        },
+        "keyword_cache": {
+            "enabled": True,                   # 形態素解析結果のキャッシュを使用する
+            "path": ".json2md-cache.sqlite",   # キャッシュファイル
+            "max_size_mb": 256                 # キャッシュの最大サイズ（超えたら古いものから削除）
+        },
+        "tokenizer": {
+            "mmap": True  # janomeの辞書をメモリマップで読み込む（ワーカープロセス間でページを共有）
         },
         "custom_tags": {
             "programming": ["code", "function", "class", "variable"],
@@ -58,6 +91,10 @@ def load_config(config_path='config.json'):
             ]
         }
     }
+
+def load_config(config_path='config.json'):
+    """Load configuration with default values"""
+    config = default_config()
     
     try:
         # First try the local config file
@@ -70,53 +107,240 @@ def load_config(config_path='config.json'):
         if os.path.exists(config_file_path):
             with open(config_file_path, 'r', encoding='utf-8') as f:
                 user_config = json.load(f)
-                if 'features' in user_config:
-                    default_config['features'].update(user_config['features'])
-                if 'custom_tags' in user_config:
-                    default_config['custom_tags'].update(user_config['custom_tags'])
-                if 'stopwords' in user_config:
-                    default_config['stopwords'].update(user_config['stopwords'])
-                if 'keyword_settings' in user_config:
-                    default_config['keyword_settings'].update(user_config['keyword_settings'])
-                default_config.update({k: v for k, v in user_config.items() 
-                                    if k not in ['features', 'custom_tags', 'stopwords', 'keyword_settings']})
+                for key in NESTED_CONFIG_KEYS:
+                    if key in user_config:
+                        config[key].update(user_config[key])
+                config.update({k: v for k, v in user_config.items() 
+                                    if k not in NESTED_CONFIG_KEYS})
                 print(f"Loaded configuration from {config_file_path}")
         else:
-            print(f"Config file not found. Using default configuration with user: {default_config['user_name']}")
+            print(f"Config file not found. Using default configuration with user: {config['user_name']}")
     except Exception as e:
-        print(f"Warning: Could not load config file ({str(e)}). Using default configuration with user: {default_config['user_name']}")
+        print(f"Warning: Could not load config file ({str(e)}). Using default configuration with user: {config['user_name']}")
     
-    return default_config
+    return config
+
+# --- プロファイリング -----------------------------------------------------------
+# 無効時はNullProfilerが使われ、各段階の計測はほぼ何もしない
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class NullProfiler:
+    """Profiler used when profiling is disabled; every call is a no-op"""
+    enabled = False
+
+    def stage(self, name, size=0):
+        return _NULL_STAGE
+
+    def add(self, name, seconds, size=0, calls=1):
+        pass
+
+    def record_conversation(self, conversation_id, title, seconds):
+        pass
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'size', 'start')
+
+    def __init__(self, profiler, name, size):
+        self.profiler = profiler
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start, self.size)
+        return False
+
+class Profiler:
+    """Records wall time, call counts and bytes processed per stage
+
+    Stage times are inclusive (render contains keyword extraction and so on).
+    The top_n slowest conversations are kept by id and title. cProfile and
+    tracemalloc captures are optional. Sizes are UTF-8 bytes of the text a
+    stage works on (for loading, of the export or the spans read from it).
+    """
+    enabled = True
+
+    def __init__(self, top_n=10, cprofile=False, trace_memory=False):
+        self.top_n = top_n
+        self.stages = {}
+        self.slowest = []  # (seconds, id, title)のヒープ
+        self.cprofile = None
+        if cprofile:
+            # プロファイリングを使わない実行では読み込まない（pstatsも同様）
+            import cProfile
+            self.cprofile = cProfile.Profile()
+        self.trace_memory = trace_memory
+        self.peak_memory = None
+        self.started = None
+        self.wall_time = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.cprofile:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile:
+            self.cprofile.disable()
+        if self.trace_memory:
+            import tracemalloc
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.wall_time = time.perf_counter() - self.started
+
+    def stage(self, name, size=0):
+        return _Stage(self, name, size)
+
+    def add(self, name, seconds, size=0, calls=1):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = {'seconds': 0.0, 'calls': 0, 'bytes': 0}
+        stats['seconds'] += seconds
+        stats['calls'] += calls
+        stats['bytes'] += size
+
+    def record_conversation(self, conversation_id, title, seconds):
+        entry = (seconds, conversation_id or '', title)
+        if len(self.slowest) < self.top_n:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def snapshot(self):
+        """Return the collected stage and conversation data (used to merge worker results)"""
+        return {'stages': self.stages, 'slowest': self.slowest}
+
+    def merge(self, snapshot):
+        for name, stats in snapshot['stages'].items():
+            self.add(name, stats['seconds'], stats['bytes'], stats['calls'])
+        for seconds, conversation_id, title in snapshot['slowest']:
+            self.record_conversation(conversation_id, title, seconds)
+
+    def report(self):
+        """Return the profile as a JSON-serializable dict"""
+        return {
+            'wall_time': self.wall_time,
+            'peak_memory': self.peak_memory,
+            'stages': {name: dict(stats) for name, stats
+                       in sorted(self.stages.items(), key=lambda item: -item[1]['seconds'])},
+            'slowest_conversations': [{'id': conversation_id, 'title': title, 'seconds': seconds}
+                                      for seconds, conversation_id, title in sorted(self.slowest, reverse=True)],
+        }
+
+    def print_summary(self, out=sys.stdout):
+        report = self.report()
+        out.write(f"\n=== Profile (wall time {report['wall_time']:.2f} s) ===\n")
+        out.write(f"{'stage':<24} {'seconds':>10} {'calls':>10} {'bytes':>14}\n")
+        for name, stats in report['stages'].items():
+            out.write(f"{name:<24} {stats['seconds']:>10.3f} {stats['calls']:>10} {stats['bytes']:>14}\n")
+        if report['peak_memory'] is not None:
+            out.write(f"Peak traced memory: {report['peak_memory'] / 1024 / 1024:.1f} MiB\n")
+        if report['slowest_conversations']:
+            out.write(f"\nSlowest {len(report['slowest_conversations'])} conversations:\n")
+            for entry in report['slowest_conversations']:
+                out.write(f"{entry['seconds']:>10.3f} s  {entry['id']}  {entry['title']}\n")
+        if self.cprofile:
+            import pstats
+            out.write("\nTop functions by cumulative time (main process):\n")
+            pstats.Stats(self.cprofile, stream=out).sort_stats('cumulative').print_stats(20)
+
+    def write_report(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        if self.cprofile:
+            self.cprofile.dump_stats(os.path.splitext(path)[0] + '.prof')
+
+_profiler = NullProfiler()
+
+def get_profiler():
+    return _profiler
+
+def set_profiler(profiler):
+    """Install the process-wide profiler (None disables profiling) and return the previous one"""
+    global _profiler
+    previous = _profiler
+    _profiler = profiler or NullProfiler()
+    return previous
+
+def utf8_size(text):
+    """Return the UTF-8 size of text for the profiler (0 without encoding it when profiling is disabled)"""
+    return len(text.encode('utf-8')) if _profiler.enabled else 0
+
+def profiled(name, size=None):
+    """Decorator recording calls of func as stage name (size: function giving the input size in bytes)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.stage(name, size(*args, **kwargs) if size else 0):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def profiled_iter(iterable, name, size=0):
+    """Yield items of iterable, recording the time spent producing them as stage name
+
+    size (bytes) is added to the stage once iterable is exhausted.
+    """
+    profiler = _profiler
+    if not profiler.enabled:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            profiler.add(name, time.perf_counter() - start, size, calls=0)
+            return
+        profiler.add(name, time.perf_counter() - start)
+        yield item
+
+# 文字化けの特徴的なパターン
+# 制御文字（0x00-0x1F, 0x7F-0x9F）、サロゲートペア、置換文字・不正なUnicode文字（U+FFFD-U+FFFF）
+CORRUPTED_TEXT_RE = re.compile('[\x00-\x1f\x7f-\x9f\ud800-\udfff\ufffd-\uffff]')
 
 def is_corrupted_text(text):
     """文字化けを検出する関数"""
-    # 制御文字（0x00-0x1F）や不正なUnicode文字を検出
-    control_chars = ''.join(map(chr, list(range(0, 32)) + list(range(127, 160))))
-    control_char_re = re.compile('[%s]' % re.escape(control_chars))
-    
-    # 文字化けの特徴的なパターン
-    corruption_patterns = [
-        r'[\ufffd\ufffe\uffff]',  # 不正なUnicode文字
-        r'[\u0000-\u0008\u000B\u000C\u000E-\u001F]',  # 制御文字
-        r'[\uD800-\uDFFF]',  # サロゲートペア
-        r'[\uFFFD]',  # 置換文字
-        r'[\uFFFE\uFFFF]',  # 不正なUnicode文字
-    ]
-    
-    # 文字化けのパターンに一致するかチェック
-    for pattern in corruption_patterns:
-        if re.search(pattern, text):
-            return True
-    
-    # 制御文字が含まれているかチェック
-    if control_char_re.search(text):
-        return True
-    
-    return False
+    return CORRUPTED_TEXT_RE.search(text) is not None
+
+def initialize_tokenizer(mmap=True):
+    """janomeの初期化
+
+    janomeはキーワード抽出で初めて必要になった時にimportする（起動時間の短縮）。
+    mmap=Trueでは辞書をメモリマップで読み込むため、読み込みが速く、
+    複数のワーカープロセスで同じページを共有できる。
+    """
+    from janome.tokenizer import Tokenizer
+    return Tokenizer(mmap=mmap)
+
+_shared_tokenizers = {}
 
-def initialize_tokenizer():
-    """janomeの初期化"""
-    return Tokenizer()
+def get_shared_tokenizer(mmap=True):
+    """プロセス内で共有するjanomeのTokenizerを取得（辞書の読み込みは1回のみ）"""
+    tokenizer = _shared_tokenizers.get(mmap)
+    if tokenizer is None:
+        tokenizer = _shared_tokenizers[mmap] = initialize_tokenizer(mmap)
+    return tokenizer
 
 def is_noun(word, tokenizer):
     """単語が名詞かどうかを判定"""
@@ -157,185 +381,644 @@ def is_unnatural_tokenization(word, tokens):
     print("→ 自然な分割と判定")
     return False
 
-def extract_keywords(text, config=None, title=None):
-    """Extract keywords from text using janome"""
-    if not config:
-        config = load_config()
-    
-    # デバッグ: タイトルの形態素解析結果を表示
-    if title and 'ちゆかいゆ' in title:
+# メッセージ解析・キーワード抽出で使用する正規表現（モジュール読み込み時に1回だけコンパイル）
+URL_RE = re.compile(r'https?://[\w/:%#\$&\?\(\)~\.=\+\-]+')
+LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+
+# コードブロックの開始（```の後に言語名と改行）。言語タグとコードブロックの検出に使う
+CODE_FENCE_RE = re.compile(r'```(\w*)\n')
+# キーワード抽出で除外する```で囲まれた範囲（言語指定行の有無を問わない）
+FENCED_TEXT_RE = re.compile(r'```.*?```', re.DOTALL)
+
+class MessageAnalysis:
+    """Result of analyzing a message once for all consumers
+
+    code_blocks: [(language, length)] of fenced code blocks ('' if no language)
+    languages: languages of every ```lang line, including unterminated
+    blocks and closing fences ('' if no language)
+    links: [(text, url)] of Markdown links
+    plain_text: text with ```-delimited ranges and URLs removed
+    first_line: first line of the text
+    """
+    __slots__ = ('code_blocks', 'languages', 'links', 'plain_text', 'first_line')
+
+    def __init__(self, code_blocks, languages, links, plain_text, first_line):
+        self.code_blocks = code_blocks
+        self.languages = languages
+        self.links = links
+        self.plain_text = plain_text
+        self.first_line = first_line
+
+@profiled('analyze_message', size=utf8_size)
+def analyze_message(text):
+    """Analyze a message text for code blocks, languages, links and keyword text
+
+    A code block starts at a ```lang line and ends at the next ```, so an
+    inline ``` in prose never hides a later block. Only plain_text removes
+    every ```-delimited range, as keyword extraction always did.
+    """
+    code_blocks = []
+    languages = []
+    code_end = 0  # 直前のコードブロックの終わり（その中のフェンスはブロックの開始にならない）
+    for fence in CODE_FENCE_RE.finditer(text):
+        lang = fence.group(1)
+        languages.append(lang)
+        if fence.start() < code_end:
+            continue
+        close = text.find('```', fence.end())
+        if close < 0:
+            code_end = len(text)  # 閉じる```がないので、以降のフェンスもブロックにならない
+            continue
+        code_blocks.append((lang, close - fence.end()))
+        code_end = close + 3
+    plain_text = URL_RE.sub('', FENCED_TEXT_RE.sub('', text))
+    newline = text.find('\n')
+    first_line = text if newline < 0 else text[:newline]
+    return MessageAnalysis(code_blocks, languages, LINK_RE.findall(text), plain_text, first_line)
+
+def message_analysis(msg):
+    """Return the analysis of a Message, computing it on first use"""
+    analysis = msg.analysis
+    if analysis is None:
+        analysis = msg.analysis = analyze_message(msg.text)
+    return analysis
+
+WHITESPACE_RE = re.compile(r'\s+')
+PUNCTUATION_RE = re.compile(r'([.,!?;:])')
+ENGLISH_WORD_RE = re.compile(r'\b[a-zA-Z][a-zA-Z0-9]{2,}\b')
+
+# タグとして不適切なキーワードのパターン（先頭一致、いずれかに一致したら除外）
+KEYWORD_EXCLUDE_RE = re.compile(
+    r'https?://'
+    r'|[\w\.-]+@[\w\.-]+$'
+    r'|[!-/:-@\[-`{-~]+$'
+    r'|[\d\.]+$'  # 数値のみのタグを除外（小数点を含む数値も除外）
+    r'|#[\d\.]+$'  # #で始まる数値のみのタグを除外
+    r'|turn\d+search\d+$'  # turnXsearchY形式の文字列を除外
+    r'|[a-z]+\d+[a-z]+\d+$'  # 文字と数字が交互に現れるパターンを除外
+)
+
+def build_stopwords(config):
+    """Build the stopword set from config"""
+    stopwords = set()
+    if config and 'stopwords' in config:
+        for lang in ['english', 'japanese', 'domain']:
+            if lang in config['stopwords']:
+                stopwords.update(config['stopwords'][lang])
+    return stopwords
+
+# 名詞の出現回数テーブルのキャッシュキーに含めるトークナイザ／辞書のバージョン
+def tokenizer_version():
+    """Version of the tokenizer and dictionary, part of the keyword cache keys"""
+    from janome.version import JANOME_VERSION
+    return f"janome-{JANOME_VERSION}/ipadic/1"
+
+class KeywordCache:
+    """SQLite cache of noun-frequency tables keyed by a hash of the preprocessed text
+
+    Entries are evicted in least-recently-used order when the database grows
+    beyond max_size_mb. Writes are batched and committed by flush().
+    """
+
+    FLUSH_INTERVAL = 1000
+
+    def __init__(self, path, max_size_mb=256):
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._touched = set()
+        self.key_prefix = f"{tokenizer_version()}\0"
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS nouns ('
+                          'key BLOB PRIMARY KEY, value BLOB NOT NULL, last_used INTEGER NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS nouns_last_used ON nouns (last_used)')
+        self.conn.commit()
+
+    def make_key(self, text):
+        """Return the key of text"""
+        return hashlib.blake2b((self.key_prefix + text).encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key):
+        """Return the cached {noun: count} table or None"""
+        value = self._pending.get(key)
+        if value is None:
+            row = self.conn.execute('SELECT value FROM nouns WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value = row[0]
+            self._touched.add(key)
+        self.hits += 1
+        return json.loads(value)
+
+    def put(self, key, counts):
+        self._pending[key] = json.dumps(counts, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if len(self._pending) >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Write pending entries and access times, then evict if over the size cap"""
+        if not self._pending and not self._touched:
+            return
+        now = time.time_ns()
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO nouns (key, value, last_used) VALUES (?, ?, ?)',
+                                  [(k, v, now) for k, v in self._pending.items()])
+            self.conn.executemany('UPDATE nouns SET last_used = ? WHERE key = ?',
+                                  [(now, k) for k in self._touched])
+        self._pending.clear()
+        self._touched.clear()
+        self.evict()
+
+    def size(self):
+        """Bytes in use by the database (excluding free pages)"""
+        page_size = self.conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = self.conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist_count = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def evict(self):
+        """Delete least recently used entries until the cache is below 90% of the cap"""
+        size = self.size()
+        if size <= self.max_bytes:
+            return
+        excess = size - int(self.max_bytes * 0.9)
+        victims = []
+        for key, length in self.conn.execute(
+                'SELECT key, length(key) + length(value) + 16 FROM nouns ORDER BY last_used'):
+            victims.append((key,))
+            excess -= length
+            if excess <= 0:
+                break
+        with self.conn:
+            self.conn.executemany('DELETE FROM nouns WHERE key = ?', victims)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def open_keyword_cache(config):
+    """Open the keyword cache configured in config, or return None if disabled"""
+    cache_settings = config.get('keyword_cache', {})
+    if not (cache_settings.get('enabled') and config['features']['use_keyword_tags']):
+        return None
+    try:
+        return KeywordCache(cache_settings.get('path', '.json2md-cache.sqlite'),
+                            cache_settings.get('max_size_mb', 256))
+    except sqlite3.Error as e:
+        print(f"Warning: Could not open keyword cache ({str(e)}). Continuing without cache.")
+        return None
+
+def format_cache_stats(stats):
+    lookups = stats['hits'] + stats['misses']
+    rate = stats['hits'] / lookups if lookups else 0.0
+    return f"Keyword cache: {stats['hits']}/{lookups} hits ({rate:.1%})"
+
+# 長いテキストを分割する位置（段落・文の区切り。空白を正規化する前のテキストで探す）
+TEXT_CHUNK_BOUNDARIES = ('\n', '。', '！', '？', '. ', '! ', '? ')
+
+def iter_text_chunks(text, size):
+    """Yield consecutive pieces of text of at most size characters
+
+    Pieces end at the last paragraph or sentence boundary in their second
+    half, else at a space, so that words are not cut in two.
+    """
+    start = 0
+    while len(text) - start > size:
+        end = start + size
+        cut = -1
+        for boundary in TEXT_CHUNK_BOUNDARIES:
+            pos = text.rfind(boundary, start + size // 2, end)
+            if pos >= 0:
+                cut = max(cut, pos + len(boundary))
+        if cut < 0:
+            pos = text.rfind(' ', start + size // 2, end)
+            cut = pos + 1 if pos >= 0 else end
+        yield text[start:cut]
+        start = cut
+    if start < len(text):
+        yield text[start:]
+
+class KeywordExtractor:
+    """Keyword extractor built once from config
+
+    Holds a shared janome Tokenizer, the keyword settings and the stopword set
+    so that they are not rebuilt for every message.
+    """
+
+    def __init__(self, config, tokenizer=None, debug=False, cache=None):
+        self.config = config
+        keyword_settings = config.get('keyword_settings', {})
+        self.min_frequency = keyword_settings.get('min_frequency', 3)
+        self.max_keywords = keyword_settings.get('max_keywords', 5)
+        self.min_length = keyword_settings.get('min_length', 2)
+        self.topK = keyword_settings.get('topK', 50)
+        self.chunk_size = keyword_settings.get('tokenize_chunk_size', 10000)
+        self.stopwords = build_stopwords(config)
+        self.mmap = config.get('tokenizer', {}).get('mmap', True)
+        self._tokenizer = tokenizer
+        self.debug = debug
+        self.cache = cache
+
+    @property
+    def tokenizer(self):
+        # キャッシュにすべてヒットした場合は辞書を読み込まない
+        if self._tokenizer is None:
+            self._tokenizer = get_shared_tokenizer(self.mmap)
+        return self._tokenizer
+
+    def preprocess(self, text):
+        """空白と記号を正規化したテキストを返す（textはコードブロック・URLを除外済みの本文）"""
+        # 1. 全角スペースを半角に変換
+        text = text.replace('　', ' ')
+        # 2. 連続するスペースを1つに
+        text = WHITESPACE_RE.sub(' ', text)
+        # 3. 記号の前後にスペースを追加
+        return PUNCTUATION_RE.sub(r' \1 ', text)
+
+    def preprocessed_chunks(self, text, analysis=None):
+        """コードブロック・URLを除外した本文を、前処理済みの断片として順に返す
+
+        chunk_sizeより長い本文は、前処理の前に段落・文の区切りで分割し、
+        断片ごとに前処理する（正規化したテキストの全体のコピーを作らず、
+        janomeにも長い文字列を一度に渡さないため）。
+        """
+        text = (analysis or analyze_message(text)).plain_text
+        if not self.chunk_size or len(text) <= self.chunk_size:
+            yield self.preprocess(text)
+            return
+        for chunk in iter_text_chunks(text, self.chunk_size):
+            yield self.preprocess(chunk)
+
+    @profiled('tokenize', size=lambda self, text: utf8_size(text))
+    def count_nouns(self, text):
+        """前処理済みテキスト中の名詞の出現回数テーブルを返す（キャッシュがあれば使用）"""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(text)
+            counts = self.cache.get(key)
+            if counts is not None:
+                return counts
+        counts = {}
+        debug_word = self.debug and 'ちゆかいゆ' in text
+        for token in self.tokenizer.tokenize(text):
+            if debug_word and token.surface == 'ちゆかいゆ':
+                print(f"  ちゆかいゆ: 品詞={token.part_of_speech}")
+            if token.part_of_speech.startswith('名詞'):
+                counts[token.surface] = counts.get(token.surface, 0) + 1
+        if key is not None:
+            self.cache.put(key, counts)
+        return counts
+
+    def count_words(self, text, analysis=None):
+        """本文の名詞と英単語の出現回数テーブルを返す（長い本文は断片ごとに数えて合算）"""
+        nouns = {}
+        english = {}
+        for chunk in self.preprocessed_chunks(text, analysis):
+            for word, count in self.count_nouns(chunk).items():
+                nouns[word] = nouns.get(word, 0) + count
+            for match in ENGLISH_WORD_RE.finditer(chunk):
+                word = match.group()
+                english[word] = english.get(word, 0) + 1
+        return nouns, english
+
+    def top_words(self, word_freq):
+        """最低出現回数以上の単語を出現回数の降順（同数は単語の昇順）で上位N件返す"""
+        frequent = [(word, freq) for word, freq in word_freq.items() if freq >= self.min_frequency]
+        frequent.sort(key=lambda x: (-x[1], x[0]))
+        return [word for word, _ in frequent[:self.max_keywords]]
+
+    def is_valid_keyword(self, keyword):
+        """タグとして使用できるキーワードかどうかを判定"""
+        return (len(keyword) >= self.min_length
+                and keyword.lower() not in self.stopwords
+                and not KEYWORD_EXCLUDE_RE.match(keyword)
+                and not is_corrupted_text(keyword))  # 文字化けしているテキストを除外
+
+    def _debug_title(self, title):
+        """タイトルの形態素解析結果を表示（デバッグ用）"""
         print("\n=== タイトルの形態素解析結果 ===")
-        tokenizer = initialize_tokenizer()
-        for token in tokenizer.tokenize(title):
+        for token in self.tokenizer.tokenize(title):
             print(f"表層形: {token.surface}\t品詞: {token.part_of_speech}\t読み: {token.reading}")
         print("=== タイトルの形態素解析結果終了 ===\n")
-        
+
         # ちゆかいゆの不自然な分割チェック
         print("\n=== ちゆかいゆの不自然な分割チェック ===")
-        tokens = list(tokenizer.tokenize('ちゆかいゆ'))
+        tokens = list(self.tokenizer.tokenize('ちゆかいゆ'))
         is_unnatural = is_unnatural_tokenization('ちゆかいゆ', tokens)
         print(f"判定結果: {'不自然な分割' if is_unnatural else '自然な分割'}")
         print("=== ちゆかいゆの不自然な分割チェック終了 ===\n")
-    
-    keyword_settings = config.get('keyword_settings', {})
-    min_frequency = keyword_settings.get('min_frequency', 3)
-    max_keywords = keyword_settings.get('max_keywords', 5)
-    min_length = keyword_settings.get('min_length', 2)
-    topK = keyword_settings.get('topK', 50)
-    
-    # デバッグ出力を有効にする
-    debug = True
-    
-    # コードブロックを除外したテキストを取得
-    text_without_code = re.sub(r'```[\s\S]*?```', '', text)
-    
-    # URLを除外したテキストを取得
-    text_without_urls = re.sub(r'https?://[\w/:%#\$&\?\(\)~\.=\+\-]+', '', text_without_code)
-    
-    # テキストの前処理
-    # 1. 全角スペースを半角に変換
-    text_without_urls = text_without_urls.replace('　', ' ')
-    # 2. 連続するスペースを1つに
-    text_without_urls = re.sub(r'\s+', ' ', text_without_urls)
-    # 3. 記号の前後にスペースを追加
-    text_without_urls = re.sub(r'([.,!?;:])', r' \1 ', text_without_urls)
-    
-    # ちゆかいゆの出現回数をチェック
-    chiyukaiyu_count = text_without_urls.count('ちゆかいゆ')
-    if debug and chiyukaiyu_count > 0:
-        print(f"\n=== キーワード抽出デバッグ ===")
-        print(f"ちゆかいゆの出現回数: {chiyukaiyu_count}")
-        print(f"タイトル: {title}")
-        if title and 'ちゆかいゆ' in title:
-            print("ちゆかいゆはタイトルに含まれています（重み付け3倍）")
-    
-    # janomeで形態素解析
-    tokenizer = initialize_tokenizer()
-    tokens = tokenizer.tokenize(text_without_urls)
-    
-    if debug and chiyukaiyu_count > 0:
-        print("\n形態素解析結果:")
-        for token in tokens:
-            if token.surface == 'ちゆかいゆ':
-                print(f"  ちゆかいゆ: 品詞={token.part_of_speech}")
-    
-    # トークンを再度取得（イテレータは1回しか使えないため）
-    tokens = tokenizer.tokenize(text_without_urls)
-    word_freq = {}
-    
-    # 不自然な分割の単語を検出して追加
-    if title and 'ちゆかいゆ' in title:
-        word_freq['ちゆかいゆ'] = 3  # タイトルに含まれる場合は3回分
-        if debug:
-            print(f"  ちゆかいゆを不自然な分割として追加: 出現回数=3")
-    
-    for token in tokens:
-        word = token.surface
-        if len(word) >= min_length:
-            # 名詞の場合、または未知語で不自然な分割の場合
-            if token.part_of_speech.startswith('名詞'):
+
+    @profiled('extract_keywords', size=lambda self, text, *args, **kwargs: utf8_size(text))
+    def extract(self, text, title=None, analysis=None):
+        """Extract keywords from text (analysis: its MessageAnalysis, if already computed)"""
+        debug = self.debug
+        min_length = self.min_length
+        title_has_chiyukaiyu = bool(title) and 'ちゆかいゆ' in title
+
+        # デバッグ: タイトルの形態素解析結果を表示
+        if debug and title_has_chiyukaiyu:
+            self._debug_title(title)
+
+        analysis = analysis or analyze_message(text)
+        noun_counts, english_counts = self.count_words(text, analysis)
+
+        # ちゆかいゆの出現回数をチェック（空白の正規化では変わらないので除外済みの本文で数える）
+        chiyukaiyu_count = analysis.plain_text.count('ちゆかいゆ') if debug else 0
+        if chiyukaiyu_count > 0:
+            print(f"\n=== キーワード抽出デバッグ ===")
+            print(f"ちゆかいゆの出現回数: {chiyukaiyu_count}")
+            print(f"タイトル: {title}")
+            if title_has_chiyukaiyu:
+                print("ちゆかいゆはタイトルに含まれています（重み付け3倍）")
+            print("\n形態素解析結果:")
+
+        word_freq = {}
+
+        # 不自然な分割の単語を検出して追加
+        if title_has_chiyukaiyu:
+            word_freq['ちゆかいゆ'] = 3  # タイトルに含まれる場合は3回分
+            if debug:
+                print(f"  ちゆかいゆを不自然な分割として追加: 出現回数=3")
+
+        # janomeで形態素解析（1回のみ）した名詞の出現回数
+        for word, count in noun_counts.items():
+            if len(word) >= min_length:
                 # タイトルに含まれる単語は出現回数を3倍に
-                if title and word in title:
-                    word_freq[word] = word_freq.get(word, 0) + 3
-                    if debug and word == 'ちゆかいゆ':
-                        print(f"  ちゆかいゆをタイトルから検出: 重み付け後の出現回数={word_freq[word]}")
-                else:
-                    word_freq[word] = word_freq.get(word, 0) + 1
-                    if debug and word == 'ちゆかいゆ':
-                        print(f"  ちゆかいゆを本文から検出: 出現回数={word_freq[word]}")
-    
-    # 最低出現回数以上の単語のみを抽出し、出現回数でソート
-    frequent_words = [(word, freq) for word, freq in word_freq.items() if freq >= min_frequency]
-    frequent_words.sort(key=lambda x: (-x[1], x[0]))  # 出現回数の降順、同じ場合は単語の昇順
-    frequent_words = [word for word, _ in frequent_words[:max_keywords]]  # 上位N件のみ
-    
-    if debug and chiyukaiyu_count > 0:
-        print(f"\n最低出現回数({min_frequency}回)以上の単語:")
-        for word, freq in sorted(word_freq.items(), key=lambda x: (-x[1], x[0])):
-            if word == 'ちゆかいゆ':
-                print(f"  ちゆかいゆ: {freq}回")
-                if freq >= min_frequency:
-                    print("  → 最低出現回数を満たしています")
-                else:
-                    print("  → 最低出現回数を満たしていません")
-    
-    # 英語の単語も抽出（最低出現回数以上出現するもののみ）
-    eng_words = re.findall(r'\b[a-zA-Z][a-zA-Z0-9]{2,}\b', text_without_urls)
-    eng_word_freq = {}
-    for word in eng_words:
-        # タイトルに含まれる単語は出現回数を3倍に
-        if title and word in title:
-            eng_word_freq[word] = eng_word_freq.get(word, 0) + 3
-        else:
-            eng_word_freq[word] = eng_word_freq.get(word, 0) + 1
-    
-    frequent_eng_words = [(word, freq) for word, freq in eng_word_freq.items() if freq >= min_frequency]
-    frequent_eng_words.sort(key=lambda x: (-x[1], x[0]))  # 出現回数の降順、同じ場合は単語の昇順
-    frequent_eng_words = [word for word, _ in frequent_eng_words[:max_keywords]]  # 上位N件のみ
-    
-    keywords = set(frequent_words + frequent_eng_words)
-    
-    # ストップワードの取得
-    stopwords = set()
-    if config and 'stopwords' in config:
-        for lang in ['english', 'japanese', 'domain']:
-            if lang in config['stopwords']:
-                stopwords.update(config['stopwords'][lang])
-    
-    filtered = [
-        k for k in keywords
-        if len(k) >= min_length
-        and k.lower() not in stopwords
-        and not re.match(r'^https?://', k)
-        and not re.match(r'^[\w\.-]+@[\w\.-]+$', k)
-        and not re.match(r'^[!-/:-@\[-`{-~]+$', k)
-        and not re.match(r'^[\d\.]+$', k)  # 数値のみのタグを除外（小数点を含む数値も除外）
-        and not re.match(r'^#[\d\.]+$', k)  # #で始まる数値のみのタグを除外
-        and not re.match(r'^turn\d+search\d+$', k)  # turnXsearchY形式の文字列を除外
-        and not re.match(r'^[a-z]+\d+[a-z]+\d+$', k)  # 文字と数字が交互に現れるパターンを除外
-        and not is_corrupted_text(k)  # 文字化けしているテキストを除外
-    ]
-    
-    if debug and chiyukaiyu_count > 0:
-        print("=== デバッグ終了 ===\n")
-    
-    return filtered
+                weight = 3 if title and word in title else 1
+                word_freq[word] = word_freq.get(word, 0) + weight * count
+                if chiyukaiyu_count > 0 and word == 'ちゆかいゆ':
+                    print(f"  ちゆかいゆを検出: 出現回数={word_freq[word]}")
+
+        frequent_words = self.top_words(word_freq)
+
+        if chiyukaiyu_count > 0 and 'ちゆかいゆ' in word_freq:
+            freq = word_freq['ちゆかいゆ']
+            print(f"\n最低出現回数({self.min_frequency}回)以上の単語:")
+            print(f"  ちゆかいゆ: {freq}回")
+            if freq >= self.min_frequency:
+                print("  → 最低出現回数を満たしています")
+            else:
+                print("  → 最低出現回数を満たしていません")
+
+        # 英語の単語も抽出（最低出現回数以上出現するもののみ）
+        eng_word_freq = {}
+        for word, count in english_counts.items():
+            # タイトルに含まれる単語は出現回数を3倍に
+            eng_word_freq[word] = 3 * count if title and word in title else count
+        frequent_eng_words = self.top_words(eng_word_freq)
+
+        keywords = set(frequent_words + frequent_eng_words)
+        filtered = [k for k in keywords if self.is_valid_keyword(k)]
+
+        if chiyukaiyu_count > 0:
+            print("=== デバッグ終了 ===\n")
+
+        return filtered
+
+    def extract_from_messages(self, messages, title=None, conversation=None):
+        """Return the keywords of all messages of a conversation"""
+        keywords = set()
+        for msg in messages:
+            keywords.update(self.extract(msg.text, title=title, analysis=message_analysis(msg)))
+        return keywords
+
+    def term_counts(self, messages, title=None):
+        """Return the weighted noun and English word counts of a conversation for corpus scoring"""
+        counts = {}
+        for msg in messages:
+            nouns, english = self.count_words(msg.text, message_analysis(msg))
+            for word, count in itertools.chain(nouns.items(), english.items()):
+                # タイトルに含まれる単語は出現回数を3倍に
+                weight = 3 if title and word in title else 1
+                counts[word] = counts.get(word, 0) + weight * count
+        return {word: count for word, count in counts.items() if self.is_valid_keyword(word)}
 
-def extract_tags_from_messages(messages, config):
-    """Extract tags from conversation messages"""
+def extract_keywords(text, config=None, title=None):
+    """Extract keywords from text using janome"""
+    if not config:
+        config = load_config()
+    return KeywordExtractor(config).extract(text, title=title)
+
+class CustomTagMatcher:
+    """Aho-Corasick automaton built once from config['custom_tags']
+
+    All conditions of all tags are matched in a single pass over the
+    lowercased text, so the cost no longer grows with the number of tags.
+    """
+
+    def __init__(self, custom_tags):
+        self.tags = list(custom_tags)
+        self.always = set()  # 空の条件を持つタグ（常に一致）
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [0]  # ノードで一致するタグのビットマスク
+        for index, (tag, conditions) in enumerate(custom_tags.items()):
+            for condition in conditions:
+                keyword = condition.lower()
+                if not keyword:
+                    self.always.add(tag)
+                    continue
+                node = 0
+                for ch in keyword:
+                    next_node = self.goto[node].get(ch)
+                    if next_node is None:
+                        next_node = len(self.goto)
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.output.append(0)
+                        self.goto[node][ch] = next_node
+                    node = next_node
+                self.output[node] |= 1 << index
+        self.all_mask = (1 << len(self.tags)) - 1
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def match_mask(self, text, found=0):
+        """Return the bitmask of tags matching the lowercased text (OR-ed into found)"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        all_mask = self.all_mask
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found |= output[state]
+                if found == all_mask:
+                    break
+        return found
+
+    def tags_for_mask(self, mask):
+        return {tag for index, tag in enumerate(self.tags) if mask >> index & 1}
+
+    @profiled('custom_tags')
+    def match(self, texts):
+        """Return the set of tags whose conditions appear in any of the texts"""
+        texts = list(texts)
+        if not texts:
+            return set()
+        found = 0
+        for text in texts:
+            found = self.match_mask(text.lower(), found)
+            if found == self.all_mask:
+                break
+        return self.tags_for_mask(found) | self.always
+
+def conversation_key(conversation):
+    """Key identifying a conversation across passes over the same export"""
+    return conversation.get('id') or f"{conversation.get('create_time', 0)}:{conversation.get('title', '')}"
+
+class CorpusKeywords:
+    """Top-K TF-IDF keywords per conversation computed over the whole export
+
+    Used in place of KeywordExtractor when keyword_settings.mode is "corpus".
+    """
+
+    def __init__(self, keywords):
+        self.keywords = keywords  # conversation_key -> [keyword]
+
+    def extract_from_messages(self, messages, title=None, conversation=None):
+        if conversation is None:
+            return set()
+        return set(self.keywords.get(conversation_key(conversation), ()))
+
+@profiled('corpus_keywords')
+def build_corpus_keywords(term_counts, config):
+    """Score terms by TF-IDF over all conversations and keep the top-K per conversation
+
+    term_counts yields (conversation_key, {term: count}). The counts are
+    collected into a sparse conversation x term matrix in COO form, and IDF
+    and the per-row top-K selection are computed with vectorized NumPy
+    operations.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise RuntimeError('Corpus keyword mode requires numpy (pip install numpy)')
+
+    keyword_settings = config.get('keyword_settings', {})
+    top_k = keyword_settings.get('max_keywords', 5)
+    min_df = keyword_settings.get('corpus_min_df', 2)
+
+    # 単語→IDの割り当てはdict.setdefaultとitertools.countでC実装のまま行う
+    # （既出の単語でもカウンタは進むので、IDは後で詰め直す）
+    vocabulary = {}
+    next_id = itertools.count()
+    keys = []
+    row_lengths = []
+    ids = []
+    counts = []
+    for key, term_count in term_counts:
+        keys.append(key)
+        row_lengths.append(len(term_count))
+        ids.extend(map(vocabulary.setdefault, term_count, next_id))
+        counts.extend(term_count.values())
+    if not keys:
+        return CorpusKeywords({})
+
+    terms = np.array(list(vocabulary), dtype=object)
+    remap = np.zeros(next(next_id), dtype=np.int64)
+    remap[np.fromiter(vocabulary.values(), dtype=np.int64, count=len(vocabulary))] = np.arange(len(terms))
+    cols = remap[np.array(ids, dtype=np.int64)]
+    del ids
+    rows = np.repeat(np.arange(len(keys), dtype=np.int64), row_lengths)
+    counts = np.array(counts, dtype=np.float64)
+
+    # 文書頻度とIDF（平滑化あり）
+    df = np.bincount(cols, minlength=len(terms))
+    idf = np.log((1 + len(keys)) / (1 + df)) + 1
+    scores = (1 + np.log(counts)) * idf[cols]
+    keep = df[cols] >= min_df
+    rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+    # 行ごとにスコアの降順（同点は単語の昇順）で上位K件を選択
+    # 行はrowsの昇順に並んでいるので、reduceatで行ごとの最大値をK回求める
+    term_order = np.empty(len(terms), dtype=np.int64)
+    term_order[np.argsort(terms, kind='stable')] = np.arange(len(terms))
+    tie_break = term_order[cols]
+    row_counts = np.bincount(rows, minlength=len(keys))
+    present = np.flatnonzero(row_counts)
+    keywords = {}
+    if not len(present):
+        return CorpusKeywords(keywords)
+    starts = np.concatenate(([0], np.cumsum(row_counts[present])[:-1]))
+    segment = np.repeat(np.arange(len(present)), row_counts[present])
+    no_term = np.iinfo(np.int64).max
+    for _ in range(top_k):
+        best = np.maximum.reduceat(scores, starts)
+        candidates = (scores == best[segment]) & (scores > -np.inf)
+        tie_keys = np.where(candidates, tie_break, no_term)
+        best_tie = np.minimum.reduceat(tie_keys, starts)
+        chosen = np.flatnonzero(candidates & (tie_keys == best_tie[segment]))
+        if not len(chosen):
+            break
+        for row, term in zip(rows[chosen].tolist(), terms[cols[chosen]].tolist()):
+            keywords.setdefault(keys[row], []).append(term)
+        scores[chosen] = -np.inf
+    return CorpusKeywords(keywords)
+
+def keyword_title(messages):
+    """Title used to weight keywords: the start of the first user message"""
+    for msg in messages:
+        if msg.role == 'user':
+            title = msg.text[:50].strip()
+            return title.replace('#', '').replace('*', '').replace('_', '').strip()
+    return None
+
+def build_tag_matcher(config):
+    """Build the custom tag matcher from config, or return None if custom tags are disabled"""
+    if not config['features']['use_custom_tags']:
+        return None
+    return CustomTagMatcher(config.get('custom_tags', {}))
+
+@profiled('extract_tags')
+def extract_tags_from_messages(messages, config, extractor=None, tag_matcher=None, conversation=None):
+    """Extract tags from conversation messages
+
+    extractor is a KeywordExtractor, or a CorpusKeywords model which looks
+    up the keywords of conversation.
+    """
     tags = set()
     
     # コードブロックの言語をタグとして追加
     if config['features']['use_language_tags']:
         for msg in messages:
-            code_matches = re.finditer(r'```(\w*)\n', msg['text'])
-            for match in code_matches:
-                lang = match.group(1)
+            for lang in message_analysis(msg).languages:
                 if lang and lang != 'plaintext':
                     tags.add(f'lang:{lang}')
     
     # キーワードをタグとして追加
     if config['features']['use_keyword_tags']:
-        # タイトルを取得
-        title = None
-        for msg in messages:
-            if msg['role'] == 'user':
-                title = msg['text'][:50].strip()
-                title = title.replace('#', '').replace('*', '').replace('_', '').strip()
-                break
-        
-        for msg in messages:
-            keywords = extract_keywords(msg['text'], config=config, title=title)
-            tags.update(keywords)
+        if extractor is None:
+            extractor = KeywordExtractor(config)
+        tags.update(extractor.extract_from_messages(messages, keyword_title(messages), conversation))
     
     # カスタムタグを追加
     if config['features']['use_custom_tags']:
-        custom_tags = config.get('custom_tags', {})
-        # カスタムタグの条件に基づいてタグを追加
-        for tag, conditions in custom_tags.items():
-            for msg in messages:
-                if any(condition.lower() in msg['text'].lower() for condition in conditions):
-                    tags.add(tag)
+        if tag_matcher is None:
+            tag_matcher = CustomTagMatcher(config.get('custom_tags', {}))
+        # カスタムタグの条件に基づいてタグを追加（各メッセージを1回だけ走査）
+        tags.update(tag_matcher.match(msg.text for msg in messages))
     
     return sorted(list(tags))
 
@@ -343,32 +1026,82 @@ def convert_timestamp(timestamp):
     """Convert timestamp to readable date format"""
     return datetime.fromtimestamp(timestamp).strftime('%m/%d/%Y %H:%M')
 
+class Message:
+    """A user or assistant message of a conversation
+
+    analysis holds the MessageAnalysis once message_analysis() has been called.
+    """
+    __slots__ = ('role', 'text', 'create_time', 'analysis')
+
+    def __init__(self, role, text, create_time):
+        self.role = role
+        self.text = text
+        self.create_time = create_time
+        self.analysis = None
+
+    @property
+    def length(self):
+        return len(self.text)
+
+def node_message(node):
+    """Return the Message of a mapping node, or None if it is not a user/assistant text message"""
+    content = node.get('message')
+    if not content:
+        return None
+    role = content.get('author', {}).get('role')
+    parts = content.get('content', {}).get('parts', [])
+    if role not in ('user', 'assistant') or not parts:
+        return None
+    text = parts[0]
+    if not text or not isinstance(text, str):
+        return None
+    return Message(role, text, content.get('create_time', 0) or node.get('create_time', 0))
+
 def extract_all_messages(mapping):
+    """Return the messages of every branch of mapping in create_time order"""
+    messages = [msg for msg in map(node_message, mapping.values()) if msg is not None]
+    messages.sort(key=lambda msg: msg.create_time)
+    return messages
+
+def extract_active_messages(mapping, current_node):
+    """Return the messages of the thread ending at current_node, from the root down
+
+    Follows the parent links, so regenerated or abandoned branches are
+    skipped and no sorting is needed. Falls back to extract_all_messages
+    if current_node is not in mapping.
+    """
+    if current_node not in mapping:
+        return extract_all_messages(mapping)
     messages = []
-    for msg in mapping.values():
-        content = msg.get('message', {})
-        if content:
-            role = content.get('author', {}).get('role')
-            parts = content.get('content', {}).get('parts', [])
-            create_time = content.get('create_time', 0) or msg.get('create_time', 0)
-            if role in ['user', 'assistant'] and parts:
-                text = parts[0]
-                if text and isinstance(text, str):
-                    messages.append({
-                        'role': role,
-                        'text': text,
-                        'create_time': create_time,
-                        'length': len(text)
-                    })
-    messages.sort(key=lambda x: x['create_time'])
+    node = mapping[current_node]
+    for _ in range(len(mapping)):  # 親の参照が循環していても止まるように上限を設ける
+        msg = node_message(node)
+        if msg is not None:
+            messages.append(msg)
+        node = mapping.get(node.get('parent'))
+        if node is None:
+            break
+    messages.reverse()
     return messages
 
+@profiled('extract_messages')
+def conversation_messages(conversation, config):
+    """Return the messages of a conversation to export
+
+    Only the active thread (ending at current_node) unless
+    features.include_all_branches is set.
+    """
+    mapping = conversation.get('mapping') or {}
+    if config['features'].get('include_all_branches'):
+        return extract_all_messages(mapping)
+    return extract_active_messages(mapping, conversation.get('current_node'))
+
 def get_title(conversation, messages):
     title = conversation.get('title', '').strip()
     if not title and messages:
         for msg in messages:
-            if msg['role'] == 'user':
-                title = msg['text'][:50].strip()
+            if msg.role == 'user':
+                title = msg.text[:50].strip()
                 title = title.replace('#', '').replace('*', '').replace('_', '').strip()
                 break
     if not title:
@@ -388,32 +1121,29 @@ def generate_filename(title, create_time):
     # タイムスタンプを含むファイル名を生成
     return f"ChatGPT-{safe_title}-{timestamp}.md"
 
+@profiled('extract_metadata')
 def extract_metadata(messages):
     """Extract metadata from messages"""
     if not messages:
         return {}
     
     total_messages = len(messages)
-    total_chars = sum(msg['length'] for msg in messages)
-    first_msg_time = messages[0]['create_time']
-    last_msg_time = messages[-1]['create_time']
+    total_chars = sum(msg.length for msg in messages)
+    first_msg_time = messages[0].create_time
+    last_msg_time = messages[-1].create_time
     duration = last_msg_time - first_msg_time
     
     # Extract code blocks and their languages
     code_blocks = []
     for msg in messages:
-        code_matches = re.finditer(r'```(\w*)\n(.*?)```', msg['text'], re.DOTALL)
-        for match in code_matches:
-            lang = match.group(1) or 'plaintext'
-            code = match.group(2)
-            code_blocks.append({'language': lang, 'length': len(code)})
+        for lang, length in message_analysis(msg).code_blocks:
+            code_blocks.append({'language': lang or 'plaintext', 'length': length})
     
     # Extract links
     links = []
     for msg in messages:
-        link_matches = re.finditer(r'\[([^\]]+)\]\(([^)]+)\)', msg['text'])
-        for match in link_matches:
-            links.append({'text': match.group(1), 'url': match.group(2)})
+        for text, url in message_analysis(msg).links:
+            links.append({'text': text, 'url': url})
     
     return {
         'total_messages': total_messages,
@@ -423,119 +1153,1677 @@ def extract_metadata(messages):
         'links': links
     }
 
-def generate_toc(messages):
-    """Generate table of contents for the conversation"""
-    toc = "## Table of Contents\n\n"
+def write_toc(messages, out, anchor_prefix=''):
+    """Write table of contents for the conversation to out
+
+    anchor_prefix is put before the section anchors (see write_message).
+    """
+    out.write("## Table of Contents\n\n")
     for i, msg in enumerate(messages, 1):
-        if msg['role'] == 'user':
+        if msg.role == 'user':
             # Use first line or first 50 chars as section title
-            title = msg['text'].split('\n')[0][:50].strip()
-            toc += f"{i}. [{title}](#section-{i})\n"
-    return toc + "\n"
+            title = message_analysis(msg).first_line[:50].strip()
+            out.write(f"{i}. [{title}](#{anchor_prefix}section-{i})\n")
+    out.write("\n")
 
-def format_message(msg, section_num, config):
-    """Format a single message with metadata"""
-    role = "User" if msg['role'] == 'user' else "Assistant"
+def generate_toc(messages):
+    """Generate table of contents for the conversation"""
+    out = io.StringIO()
+    write_toc(messages, out)
+    return out.getvalue()
+
+def write_message(msg, section_num, config, out, anchor_prefix=''):
+    """Write a single message with metadata to out
+
+    anchor_prefix makes the section anchors unique when several
+    conversations share one Markdown document.
+    """
+    role = "User" if msg.role == 'user' else "Assistant"
     
     # Add section anchor for user messages
-    if msg['role'] == 'user':
-        header = f"## <a id='section-{section_num}'></a>Prompt:\n"
+    if msg.role == 'user':
+        header = f"## <a id='{anchor_prefix}section-{section_num}'></a>Prompt:\n"
     else:
         header = "## Response:\n"
     
     # Add metadata based on config
     metadata_parts = []
     if config['features']['show_timestamps']:
-        metadata_parts.append(convert_timestamp(msg['create_time']))
+        metadata_parts.append(convert_timestamp(msg.create_time))
     if config['features']['show_message_length']:
-        metadata_parts.append(f"{msg['length']} characters")
+        metadata_parts.append(f"{msg.length} characters")
     
     metadata = f"*{role}"
     if metadata_parts:
         metadata += " • " + " • ".join(metadata_parts)
     metadata += "*\n\n"
     
-    return header + metadata + msg['text'] + "\n\n"
+    # 本文は連結せずにそのまま書き込む（長い応答のコピーを避ける）
+    out.write(header + metadata)
+    out.write(msg.text)
+    out.write("\n\n")
+
+def format_message(msg, section_num, config):
+    """Format a single message with metadata"""
+    out = io.StringIO()
+    write_message(msg, section_num, config, out)
+    return out.getvalue()
+
+def write_markdown(conversation, config, out, extractor=None, tag_matcher=None, messages=None, anchor_prefix=''):
+    """Render a conversation as Markdown, writing each section to the text sink out
 
-def convert_to_markdown(conversation, config):
-    messages = extract_all_messages(conversation.get('mapping', {}))
+    messages: result of conversation_messages() if already extracted.
+    anchor_prefix: prefix of the section anchors (see write_message).
+    Returns (title, messages, metadata, tags) of the rendered conversation,
+    where metadata is the result of extract_metadata().
+    """
+    if messages is None:
+        messages = conversation_messages(conversation, config)
+    profiler = _profiler
+    if profiler.enabled:
+        start = time.perf_counter()
+        rendered = _write_markdown(conversation, config, out, extractor, tag_matcher, messages, anchor_prefix)
+        elapsed = time.perf_counter() - start
+        profiler.add('render', elapsed)
+        profiler.record_conversation(conversation.get('id'), rendered[0], elapsed)
+        return rendered
+    return _write_markdown(conversation, config, out, extractor, tag_matcher, messages, anchor_prefix)
+
+def _write_markdown(conversation, config, out, extractor, tag_matcher, messages, anchor_prefix):
     title = get_title(conversation, messages)
     create_time = conversation.get('create_time', 0)
     update_time = convert_timestamp(conversation.get('update_time', 0))
     
     # Extract metadata and tags
     metadata = extract_metadata(messages)
-    tags = extract_tags_from_messages(messages, config)
+    tags = extract_tags_from_messages(messages, config, extractor, tag_matcher, conversation)
     
-    # Start building markdown
-    markdown = f"# {title}\n\n"
+    out.write(f"# {title}\n\n")
     
     # Add tags if enabled
     if config['features']['show_tags'] and tags:
-        markdown += "### Tags\n\n"
-        markdown += " ".join([f"#{tag}" for tag in tags]) + "\n\n"
+        out.write("### Tags\n\n")
+        out.write(" ".join([f"#{tag}" for tag in tags]) + "\n\n")
     
     # Add user info from config
     user_name = config.get('user_name', 'Unknown User')
     user_email = config.get('user_email', '')
     if user_email:
-        markdown += f"**User:** {user_name} ({user_email})  \n"
+        out.write(f"**User:** {user_name} ({user_email})  \n")
     else:
-        markdown += f"**User:** {user_name}  \n"
+        out.write(f"**User:** {user_name}  \n")
     
     # Add timestamps
-    markdown += f"**Created:** {convert_timestamp(create_time)}  \n"
-    markdown += f"**Updated:** {update_time}  \n"
-    markdown += f"**Exported:** {datetime.now().strftime('%m/%d/%Y %H:%M')}  \n\n"
+    out.write(f"**Created:** {convert_timestamp(create_time)}  \n"
+              f"**Updated:** {update_time}  \n"
+              f"**Exported:** {datetime.now().strftime('%m/%d/%Y %H:%M')}  \n\n")
     
     # Add conversation metadata if enabled
     if config['features']['show_statistics']:
-        markdown += "### Conversation Statistics\n\n"
-        markdown += f"- Total Messages: {metadata['total_messages']}\n"
-        markdown += f"- Total Characters: {metadata['total_chars']}\n"
-        markdown += f"- Duration: {metadata['duration']/3600:.1f} hours\n\n"
+        out.write("### Conversation Statistics\n\n"
+                  f"- Total Messages: {metadata['total_messages']}\n"
+                  f"- Total Characters: {metadata['total_chars']}\n"
+                  f"- Duration: {metadata['duration']/3600:.1f} hours\n\n")
     
     # Add code blocks summary if enabled and available
     if config['features']['show_code_blocks'] and metadata['code_blocks']:
-        markdown += "### Code Blocks\n\n"
+        out.write("### Code Blocks\n\n")
         for block in metadata['code_blocks']:
-            markdown += f"- {block['language']}: {block['length']} characters\n"
-        markdown += "\n"
+            out.write(f"- {block['language']}: {block['length']} characters\n")
+        out.write("\n")
     
     # Add links summary if enabled and available
     if config['features']['show_links'] and metadata['links']:
-        markdown += "### Links\n\n"
+        out.write("### Links\n\n")
         for link in metadata['links']:
-            markdown += f"- [{link['text']}]({link['url']})\n"
-        markdown += "\n"
+            out.write(f"- [{link['text']}]({link['url']})\n")
+        out.write("\n")
     
     # Add table of contents if enabled and threshold met
     if (config['features']['show_toc'] and 
         len(messages) >= config['features']['toc_threshold']):
-        markdown += generate_toc(messages)
+        write_toc(messages, out, anchor_prefix)
     
     # Add messages
     for i, msg in enumerate(messages, 1):
-        markdown += format_message(msg, i, config)
-    
-    return markdown
+        write_message(msg, i, config, out, anchor_prefix)
+    return title, messages, metadata, tags
 
-def process_json_file(input_file, output_dir='output', config_path='config.json'):
-    os.makedirs(output_dir, exist_ok=True)
+def convert_to_markdown(conversation, config, extractor=None, tag_matcher=None, messages=None):
+    out = io.StringIO()
+    write_markdown(conversation, config, out, extractor, tag_matcher, messages)
+    return out.getvalue()
+
+STREAM_CHUNK_SIZE = 1024 * 1024  # ストリーム読み込み時の1回あたりの読み込み文字数
+
+_json_decoder = json.JSONDecoder()
+_json_whitespace = ' \t\n\r'
+
+def iter_conversations(input_file, chunk_size=STREAM_CHUNK_SIZE, spans=False):
+    """Yield conversation objects one at a time from the top-level JSON array
+
+    Only the conversation being decoded is kept in memory, so peak memory
+    depends on the largest conversation rather than on the whole export.
+    With spans=True, yields (conversation, start, end) with the byte offsets
+    of the conversation's JSON object in the file.
+    """
+    # 改行を変換せずに読む（\r\nを1文字として数えるとバイト位置がずれる）
+    with open(input_file, 'r', encoding='utf-8', newline='') as f:
+        buffer = f.read(chunk_size)
+        pos = 0
+        byte_pos = 0  # posのファイル先頭からのバイト位置
+        eof = not buffer
+
+        def fill(min_size):
+            # バッファに未処理分＋min_size文字以上が入るまで読み足す
+            nonlocal buffer, pos, eof
+            buffer = buffer[pos:]
+            pos = 0
+            while not eof and len(buffer) < min_size:
+                data = f.read(max(chunk_size, min_size - len(buffer)))
+                if not data:
+                    eof = True
+                buffer += data
+
+        def skip_whitespace():
+            nonlocal pos, byte_pos
+            while True:
+                start = pos
+                while pos < len(buffer) and buffer[pos] in _json_whitespace:
+                    pos += 1
+                byte_pos += pos - start  # 空白はすべて1バイト
+                if pos < len(buffer) or eof:
+                    return
+                fill(1)
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != '[':
+            raise ValueError(f"{input_file}: expected a JSON array of conversations")
+        pos += 1
+        byte_pos += 1
+        expect_value = True
+        first = True
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ValueError(f"{input_file}: unexpected end of file")
+            if buffer[pos] == ']' and (first or not expect_value):
+                return
+            if not expect_value:
+                if buffer[pos] != ',':
+                    raise ValueError(f"{input_file}: expected ',' or ']' between conversations")
+                pos += 1
+                byte_pos += 1
+                expect_value = True
+                continue
+            # 要素を1つデコード。途中で切れている場合はバッファを倍々に広げて再試行
+            while True:
+                try:
+                    conversation, end = _json_decoder.raw_decode(buffer, pos)
+                    break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill(2 * (len(buffer) - pos))
+            start_byte = byte_pos
+            if spans:
+                byte_pos += len(buffer[pos:end].encode('utf-8'))
+            pos = end
+            expect_value = False
+            first = False
+            yield (conversation, start_byte, byte_pos) if spans else conversation
+
+def load_conversations(input_file, stream=True):
+    """Return an iterable of conversations (streamed by default)"""
+    if stream:
+        return iter_conversations(input_file)
     with open(input_file, 'r', encoding='utf-8') as f:
-        conversations = json.load(f)
-    config = load_config(config_path)
-    for i, conversation in enumerate(conversations):
-        messages = extract_all_messages(conversation.get('mapping', {}))
-        title = get_title(conversation, messages)
-        create_time = conversation.get('create_time', 0)
-        filename = generate_filename(title, create_time)
-        markdown_content = convert_to_markdown(conversation, config)
-        output_path = os.path.join(output_dir, filename)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(markdown_content)
-        print(f"Created: {output_path}")
+        return json.load(f)
+
+OFFSET_INDEX_SUFFIX = '.json2md-offsets.sqlite'
+OFFSET_INDEX_VERSION = 2  # 1: CRLFのファイルでバイト位置がずれていた
+
+def parse_time(value, end_of_day=False):
+    """Parse an ISO date or date-time (local time) to a timestamp
+
+    With end_of_day, a plain date means the end of that day, so that
+    --until 2024-01-31 includes the whole day.
+    """
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.timestamp()
+
+class ConversationSelection:
+    """Selects conversations by id, create_time range [since, until) and title regex
+
+    Criteria left as None match every conversation.
+    """
+
+    def __init__(self, ids=None, since=None, until=None, title=None):
+        self.ids = set(ids) if ids else None
+        self.since = since
+        self.until = until
+        self.title_re = re.compile(title) if title else None
+
+    def matches(self, conversation_id, title, create_time):
+        if self.ids is not None and conversation_id not in self.ids:
+            return False
+        if self.since is not None and (create_time is None or create_time < self.since):
+            return False
+        if self.until is not None and (create_time is None or create_time >= self.until):
+            return False
+        return self.title_re is None or bool(self.title_re.search(title or ''))
+
+    def matches_conversation(self, conversation):
+        return self.matches(conversation.get('id'), conversation.get('title'), conversation.get('create_time'))
+
+class OffsetIndex:
+    """Index of the byte span of each conversation in an export, stored next to it
+
+    The index records the size and modification time of the export and is
+    rebuilt by ensure_current() whenever they change.
+    """
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.path = input_file + OFFSET_INDEX_SUFFIX
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS conversations (
+                seq INTEGER PRIMARY KEY, id TEXT, title TEXT, create_time REAL, update_time REAL,
+                start INTEGER NOT NULL, end INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS conversations_id ON conversations (id);
+            CREATE INDEX IF NOT EXISTS conversations_create_time ON conversations (create_time);
+        ''')
+
+    def source_signature(self):
+        stat = os.stat(self.input_file)
+        return f"{OFFSET_INDEX_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def is_current(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        return row is not None and row[0] == self.source_signature()
+
+    def build(self):
+        """Scan the export once and record every conversation's byte span"""
+        signature = self.source_signature()
+        with self.conn:
+            self.conn.execute('DELETE FROM conversations')
+            self.conn.executemany(
+                'INSERT INTO conversations (id, title, create_time, update_time, start, end) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                ((c.get('id'), c.get('title'), c.get('create_time'), c.get('update_time'), start, end)
+                 for c, start, end in iter_conversations(self.input_file, spans=True)))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source', ?)", (signature,))
+        return self.conn.execute('SELECT count(*) FROM conversations').fetchone()[0]
+
+    def ensure_current(self):
+        if not self.is_current():
+            count = self.build()
+            print(f"Indexed {count} conversations of {self.input_file}")
+
+    def spans(self, selection):
+        """Return the (start, end) byte spans of the selected conversations in file order"""
+        conditions = []
+        params = []
+        if selection.ids is not None:
+            conditions.append(f"id IN ({', '.join('?' * len(selection.ids))})")
+            params.extend(selection.ids)
+        if selection.since is not None:
+            conditions.append('create_time >= ?')
+            params.append(selection.since)
+        if selection.until is not None:
+            conditions.append('create_time < ?')
+            params.append(selection.until)
+        if selection.title_re is not None:
+            self.conn.create_function('title_matches', 1,
+                                      lambda title: bool(selection.title_re.search(title or '')),
+                                      deterministic=True)
+            conditions.append('title_matches(title)')
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return self.conn.execute(f'SELECT start, end FROM conversations {where} ORDER BY seq', params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+def iter_spans(input_file, spans):
+    """Yield the conversations at the given byte spans of input_file, parsing only those"""
+    if not spans:
+        return
+    with open(input_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for start, end in spans:
+            # 読み込んだバイト数はprofiled_iterで計測しているload段階に加える
+            _profiler.add('load', 0.0, end - start, calls=0)
+            yield json.loads(data[start:end])
+
+def select_conversations(input_file, selection):
+    """Yield the conversations of input_file matching selection
+
+    Uses the offset index next to input_file (built or rebuilt first if
+    needed) to parse only the selected conversations. If the index cannot
+    be written there, the export is streamed and filtered instead.
+    """
+    try:
+        index = OffsetIndex(input_file)
+        try:
+            index.ensure_current()
+            spans = index.spans(selection)
+        finally:
+            index.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: Could not use the offset index ({str(e)}). Reading the whole export.")
+        yield from (c for c in iter_conversations(input_file) if selection.matches_conversation(c))
+        return
+    yield from iter_spans(input_file, spans)
+
+def short_hash(data):
+    """Return a 64-bit hash of bytes as an int"""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+def conversation_digest(conversation):
+    """Return a 64-bit hash of the conversation's content, independent of key order and formatting"""
+    payload = json.dumps(conversation, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return short_hash(payload.encode('utf-8'))
+
+class MergedExports:
+    """The conversations of several exports with each conversation only once
+
+    Copies are matched by id (by content hash if there is none). Copies
+    with the same content hash are duplicates; otherwise the copy with the
+    newest update_time is kept, or the one from the later export if the
+    update_times are equal. The exports are scanned once in the
+    constructor, keeping only 64-bit hashes, update_times and byte spans in
+    arrays; iterating parses just the kept conversations again from their
+    files, so the merged exports can be iterated more than once.
+    """
+
+    def __init__(self, input_files):
+        self.input_files = list(input_files)
+        self.slots = {}  # idまたは内容のハッシュ -> 以下の配列の添字
+        self.update_times = array('d')
+        self.digests = array('Q')
+        self.sources = array('L')  # input_filesの番号
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.total = 0
+        for source, input_file in enumerate(self.input_files):
+            for conversation, start, end in iter_conversations(input_file, spans=True):
+                self.add(conversation, source, start, end)
+
+    def add(self, conversation, source, start, end):
+        self.total += 1
+        digest = conversation_digest(conversation)
+        conversation_id = conversation.get('id')
+        key = short_hash(b'id:' + conversation_id.encode('utf-8')) if conversation_id else digest
+        update_time = conversation.get('update_time') or 0
+        slot = self.slots.get(key)
+        if slot is None:
+            self.slots[key] = len(self.starts)
+            self.update_times.append(update_time)
+            self.digests.append(digest)
+            self.sources.append(source)
+            self.starts.append(start)
+            self.ends.append(end)
+        elif self.digests[slot] != digest and update_time >= self.update_times[slot]:
+            self.update_times[slot] = update_time
+            self.digests[slot] = digest
+            self.sources[slot] = source
+            self.starts[slot] = start
+            self.ends[slot] = end
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def duplicates(self):
+        return self.total - len(self)
+
+    def __iter__(self):
+        # 残したコピーをファイルごとにファイル内の順に読む
+        order = sorted(range(len(self)), key=lambda i: (self.sources[i], self.starts[i]))
+        for source, slots in itertools.groupby(order, key=self.sources.__getitem__):
+            yield from iter_spans(self.input_files[source], ((self.starts[i], self.ends[i]) for i in slots))
+
+def conversation_filename(conversation, messages):
+    """Return the output filename of a conversation with the given messages"""
+    title = get_title(conversation, messages)
+    return generate_filename(title, conversation.get('create_time', 0))
+
+# convert_conversationsが返す変換結果（タプルとして展開できる）
+ConvertedConversation = namedtuple('ConvertedConversation', ['filename', 'markdown', 'metadata', 'tags'])
+
+def render_conversation(conversation, config, extractor=None, tag_matcher=None, include_messages=False,
+                        prefix_anchors=False):
+    """Convert one conversation in memory and return a ConvertedConversation
+
+    metadata holds the conversation's id, title, create_time and update_time
+    together with the statistics of extract_metadata(); with include_messages
+    it also holds the rendered messages as (role, create_time, text) tuples.
+    prefix_anchors: prefix the section anchors with the conversation's
+    anchor (combined_anchor) for a Markdown document of many conversations.
+    """
+    out = io.StringIO()
+    messages = conversation_messages(conversation, config)
+    anchor_prefix = ''
+    if prefix_anchors:
+        anchor_prefix = combined_anchor(conversation_filename(conversation, messages)) + '-'
+    title, messages, statistics, tags = write_markdown(conversation, config, out, extractor, tag_matcher,
+                                                       messages, anchor_prefix)
+    create_time = conversation.get('create_time', 0)
+    metadata = {
+        'id': conversation.get('id'),
+        'title': title,
+        'create_time': create_time,
+        'update_time': conversation.get('update_time', 0),
+    }
+    metadata.update(statistics)
+    if include_messages:
+        metadata['messages'] = [(msg.role, msg.create_time, msg.text) for msg in messages]
+    return ConvertedConversation(generate_filename(title, create_time), out.getvalue(), metadata, tags)
+
+PARALLEL_CHUNK_SIZE = 16  # 並列変換時に1タスクで変換する会話数
+
+# ワーカープロセスごとに1回だけ初期化される設定・キーワード抽出器・カスタムタグ照合器
+_worker_config = None
+_worker_extractor = None
+_worker_tag_matcher = None
+
+def _init_worker(config, debug=False, profile_top_n=None, keyword_model=None, keyword_cache=True):
+    global _worker_config, _worker_extractor, _worker_tag_matcher
+    _worker_config = config
+    if keyword_model is not None:
+        _worker_extractor = keyword_model
+    elif config['features']['use_keyword_tags']:
+        cache = open_keyword_cache(config) if keyword_cache else None
+        _worker_extractor = KeywordExtractor(config, debug=debug, cache=cache)
+    else:
+        _worker_extractor = None
+    _worker_tag_matcher = build_tag_matcher(config)
+    if profile_top_n is not None:
+        set_profiler(Profiler(top_n=profile_top_n))
+
+def _render_one(conversation, include_messages=False, prefix_anchors=False):
+    return render_conversation(conversation, _worker_config, _worker_extractor, _worker_tag_matcher,
+                               include_messages, prefix_anchors)
+
+def _term_counts_one(conversation):
+    return conversation_term_counts(conversation, _worker_config, _worker_extractor)
+
+def _run_chunk(func, items):
+    results = [func(item) for item in items]
+    # キャッシュはチャンクごとに書き込み、このチャンク分の統計を返す
+    stats = {}
+    cache = getattr(_worker_extractor, 'cache', None)
+    if cache is not None:
+        cache.flush()
+        stats['cache'] = cache.stats()
+        cache.hits = cache.misses = 0
+    if _profiler.enabled:
+        stats['profile'] = _profiler.snapshot()
+        set_profiler(Profiler(top_n=_profiler.top_n))
+    return results, stats
+
+def iter_chunks(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def add_cache_stats(total, stats):
+    """Add keyword cache stats (see KeywordCache.stats) to the running total"""
+    for key in stats:
+        total[key] = total.get(key, 0) + stats[key]
+
+def map_parallel(func, items, config, jobs, chunk_size=PARALLEL_CHUNK_SIZE, cache_stats=None, debug=False,
+                 keyword_model=None, keyword_cache=True):
+    """Apply a worker function to items on a process pool and yield the results in input order
+
+    At most 2 * jobs chunks are in flight, so a streamed input is never
+    read ahead further than that. Keyword cache hits of the workers are
+    added to cache_stats, and their stage timings are merged into the
+    current profiler. keyword_cache=False keeps the workers from opening
+    the keyword cache.
+    """
+    profiler = _profiler
+
+    def chunk_results(future):
+        results, stats = future.result()
+        if 'cache' in stats and cache_stats is not None:
+            add_cache_stats(cache_stats, stats['cache'])
+        if 'profile' in stats:
+            profiler.merge(stats['profile'])
+        return results
+
+    profile_top_n = profiler.top_n if profiler.enabled else None
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(config, debug, profile_top_n, keyword_model, keyword_cache)) as executor:
+        pending = deque()
+        for chunk in iter_chunks(items, chunk_size):
+            pending.append(executor.submit(_run_chunk, func, chunk))
+            if len(pending) >= 2 * jobs:
+                yield from chunk_results(pending.popleft())
+        while pending:
+            yield from chunk_results(pending.popleft())
+
+def convert_conversations(conversations, config=None, jobs=1, extractor=None, tag_matcher=None,
+                          keyword_cache=False, include_messages=False, prefix_anchors=False, cache_stats=None,
+                          debug=False):
+    """Convert an iterable of conversation dicts lazily and yield a ConvertedConversation for each
+
+    Each result unpacks as (filename, markdown, metadata, tags); see
+    render_conversation for metadata. Nothing is written or printed, and
+    conversations are only taken from the iterable as results are
+    consumed (with jobs > 1, at most 2 * jobs chunks of PARALLEL_CHUNK_SIZE
+    ahead), so any streaming source and sink can be chained.
+
+    config: configuration dict (default_config() if None).
+    extractor: keyword extractor to use instead of a KeywordExtractor built
+    from config; it is required in corpus mode (the model returned by
+    build_corpus_keywords). With jobs > 1 it is sent to the worker
+    processes, which build their own tag matcher from config.
+    keyword_cache: use the keyword cache file configured in config.
+    include_messages, prefix_anchors: see render_conversation.
+    cache_stats: dict to add the keyword cache hits and misses to.
+    """
+    if config is None:
+        config = default_config()
+    use_keywords = config['features']['use_keyword_tags']
+    if use_keywords and extractor is None and config['keyword_settings'].get('mode') == 'corpus':
+        raise ValueError("corpus keyword mode needs the extractor returned by build_corpus_keywords")
+    if jobs > 1:
+        yield from map_parallel(functools.partial(_render_one, include_messages=include_messages,
+                                                  prefix_anchors=prefix_anchors),
+                                conversations, config, jobs, cache_stats=cache_stats, debug=debug,
+                                keyword_model=extractor, keyword_cache=keyword_cache)
+        return
+    cache = None
+    if extractor is None and use_keywords:
+        cache = open_keyword_cache(config) if keyword_cache else None
+        extractor = KeywordExtractor(config, debug=debug, cache=cache)
+    if tag_matcher is None:
+        tag_matcher = build_tag_matcher(config)
+    try:
+        for conversation in conversations:
+            yield render_conversation(conversation, config, extractor, tag_matcher, include_messages,
+                                      prefix_anchors)
+    finally:
+        if cache is not None:
+            if cache_stats is not None:
+                add_cache_stats(cache_stats, cache.stats())
+            cache.close()
+
+def conversation_term_counts(conversation, config, extractor):
+    """Return (conversation_key, term counts) of a conversation for corpus keyword scoring"""
+    messages = conversation_messages(conversation, config)
+    return conversation_key(conversation), extractor.term_counts(messages, keyword_title(messages))
+
+MANIFEST_FILENAME = '.json2md-manifest.json'
+MANIFEST_VERSION = 1
+OUTPUT_FORMAT_VERSION = 2  # 出力形式を変更したら上げる（既存の出力がすべて再生成される）
+
+def config_fingerprint(config):
+    """Return a short hash of the settings that affect the rendered output"""
+    rendered_config = {k: v for k, v in config.items() if k not in ('keyword_cache', 'tokenizer')}
+    payload = json.dumps({'format': OUTPUT_FORMAT_VERSION, 'config': rendered_config},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+class ExportManifest:
+    """Manifest in the output directory mapping conversation id to its last export
+
+    Each entry holds the conversation's update_time, the config fingerprint
+    and the output filename it was written to.
+    """
+
+    def __init__(self, output_dir, fingerprint):
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.output_dir = output_dir
+        self.fingerprint = fingerprint
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.entries = data.get('conversations', {})
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read manifest ({str(e)}). All conversations will be exported.")
+
+    def is_unchanged(self, conversation):
+        """True if the conversation was exported with the same update_time and config and the file still exists"""
+        entry = self.entries.get(conversation.get('id'))
+        return (entry is not None
+                and entry['update_time'] == conversation.get('update_time', 0)
+                and entry['config'] == self.fingerprint
+                and os.path.exists(os.path.join(self.output_dir, entry['filename'])))
+
+    def record(self, conversation_id, update_time, filename):
+        """Record an export and return the previous filename if it is no longer used"""
+        previous = self.entries.get(conversation_id)
+        self.entries[conversation_id] = {
+            'update_time': update_time,
+            'config': self.fingerprint,
+            'filename': filename,
+        }
+        if previous is None or previous['filename'] == filename:
+            return None
+        # 他の会話が同じファイル名を使っている場合は残す
+        if any(e['filename'] == previous['filename'] for e in self.entries.values()):
+            return None
+        return previous['filename']
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'conversations': self.entries},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+SEARCH_INDEX_FILENAME = 'json2md-index.sqlite'
+
+def search_rows(metadata, tags, anchor=''):
+    """Return the search index entry for SearchIndex.add of a conversation
+    converted with include_messages (see render_conversation)
+
+    section is the anchor of the message's section: the user message itself,
+    or the preceding user message for a response. anchor is the anchor of
+    the conversation in a combined Markdown file, which prefixes its
+    section anchors there (see SingleFileOutput.search_target).
+    """
+    rows = []
+    section = anchor
+    for i, (role, create_time, text) in enumerate(metadata['messages'], 1):
+        if role == 'user':
+            section = f'{anchor}-section-{i}' if anchor else f'section-{i}'
+        rows.append((role, create_time, section, text))
+    return {'id': metadata['id'], 'title': metadata['title'], 'tags': ' '.join(tags), 'messages': rows}
+
+class SearchIndexUnavailable(Exception):
+    """Raised when the SQLite library has no FTS5 trigram tokenizer (needs SQLite 3.34 or later)"""
+
+class SearchIndex:
+    """SQLite FTS5 full-text index of the exported messages
+
+    Messages of a conversation get consecutive rowids, which are recorded
+    in the conversations table so that a re-exported conversation can be
+    replaced without scanning the index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        try:
+            self._create_tables()
+        except sqlite3.OperationalError as e:
+            self.conn.close()
+            if 'fts5' in str(e) or 'trigram' in str(e):
+                raise SearchIndexUnavailable(
+                    f"The search index needs SQLite 3.34 or later with FTS5, "
+                    f"but this Python uses SQLite {sqlite3.sqlite_version} ({str(e)})") from e
+            raise
+        row = self.conn.execute('SELECT rowid FROM messages ORDER BY rowid DESC LIMIT 1').fetchone()
+        self.next_rowid = row[0] + 1 if row else 1
+
+    def _create_tables(self):
+        self.conn.executescript('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+                title, tags, text, role UNINDEXED, create_time UNINDEXED,
+                conversation_id UNINDEXED, filename UNINDEXED, section UNINDEXED,
+                tokenize = 'trigram');
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY, filename TEXT NOT NULL,
+                first_rowid INTEGER NOT NULL, last_rowid INTEGER NOT NULL);
+        ''')
+
+    def has(self, conversation_id):
+        return self.conn.execute('SELECT 1 FROM conversations WHERE id = ?', (conversation_id,)).fetchone() is not None
+
+    def add(self, filename, rows):
+        """Replace the indexed messages of a conversation with an entry from search_rows()"""
+        conversation_id = rows['id']
+        if conversation_id is not None:
+            self.remove(conversation_id)
+        first_rowid = self.next_rowid
+        self.next_rowid += len(rows['messages'])
+        self.conn.executemany(
+            'INSERT INTO messages (rowid, title, tags, text, role, create_time, conversation_id, filename, section) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(first_rowid + i, rows['title'], rows['tags'], text, role, create_time, conversation_id, filename, section)
+             for i, (role, create_time, section, text) in enumerate(rows['messages'])])
+        if conversation_id is not None:
+            self.conn.execute('INSERT INTO conversations (id, filename, first_rowid, last_rowid) VALUES (?, ?, ?, ?)',
+                              (conversation_id, filename, first_rowid, first_rowid + len(rows['messages']) - 1))
+
+    def remove(self, conversation_id):
+        row = self.conn.execute('SELECT first_rowid, last_rowid FROM conversations WHERE id = ?',
+                                (conversation_id,)).fetchone()
+        if row is not None:
+            self.conn.execute('DELETE FROM messages WHERE rowid BETWEEN ? AND ?', row)
+            self.conn.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
+
+    def search(self, query, limit=20):
+        """Return matching messages as dicts with the file and section anchor to open
+
+        Terms of 3 or more characters use the trigram index; shorter terms
+        (e.g. 2-character Japanese words) are matched by substring. Both
+        ignore the case of ASCII letters.
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        long_terms = [t for t in terms if len(t) >= 3]
+        conditions = []
+        params = []
+        if long_terms:
+            conditions.append('messages MATCH ?')
+            params.append(' AND '.join('"' + t.replace('"', '""') + '"' for t in long_terms))
+        for term in terms:
+            if len(term) < 3:
+                conditions.append('(instr(lower(text), ?) OR instr(lower(title), ?) OR instr(lower(tags), ?))')
+                params.extend([term.lower()] * 3)
+        order = 'ORDER BY rank' if long_terms else 'ORDER BY rowid'
+        cursor = self.conn.execute(
+            'SELECT conversation_id, title, role, create_time, filename, section, '
+            "snippet(messages, 2, '[', ']', '...', 16), text "
+            f"FROM messages WHERE {' AND '.join(conditions)} {order} LIMIT ?",
+            params + [limit])
+        results = []
+        for conversation_id, title, role, create_time, filename, section, snippet, text in cursor:
+            if not long_terms:
+                # 部分一致のみの場合はFTSのスニペットが使えないので前後を切り出す
+                pos = max(text.lower().find(terms[0].lower()), 0)
+                snippet = text[max(pos - 20, 0):pos + 40].replace('\n', ' ')
+            results.append({
+                'conversation_id': conversation_id,
+                'title': title,
+                'role': role,
+                'create_time': create_time,
+                'filename': filename,
+                'anchor': f'#{section}' if section else '',
+                'snippet': snippet.replace('\n', ' '),
+            })
+        return results
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+def search_export(output_dir, query, limit=20):
+    """Search the index in output_dir and return the matches (see SearchIndex.search)"""
+    path = os.path.join(output_dir, SEARCH_INDEX_FILENAME)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No search index in {output_dir} (run the conversion with --index first)")
+    index = SearchIndex(path)
+    try:
+        return index.search(query, limit)
+    finally:
+        index.close()
+
+DEFAULT_WRITER_THREADS = 4
+
+# 同じ内容かどうかの比較ではExported:の日時を無視する（実行のたびに変わるため）
+EXPORTED_LINE_RE = re.compile(rb'\*\*Exported:\*\* [^\r\n]*')
+
+def encode_output(text):
+    """Return the bytes of text as written in text mode (platform line endings, UTF-8)"""
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    return text.encode('utf-8')
+
+def has_same_output(path, data):
+    """True if the file at path already holds data, apart from the Exported: time"""
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            existing = f.read()
+    except OSError:
+        return False
+    return (existing == data
+            or EXPORTED_LINE_RE.sub(b'', existing, count=1) == EXPORTED_LINE_RE.sub(b'', data, count=1))
+
+def write_file_atomic(path, text):
+    """Write text to path via a temporary file and rename, unless it already has the same content
+
+    Returns False if the write was skipped.
+    """
+    data = encode_output(text)
+    if has_same_output(path, data):
+        return False
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+class OutputWriter:
+    """Writes output files on a thread pool while the caller keeps converting
+
+    At most 2 * threads writes are queued; write() blocks on the oldest one
+    beyond that. The done callbacks run on the calling thread in the order
+    the writes were submitted, with True if the file was written and False
+    if it already had the same content. threads=0 writes synchronously.
+    """
+
+    def __init__(self, output_dir, threads=DEFAULT_WRITER_THREADS):
+        self.output_dir = output_dir
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 0 else None
+        self.max_pending = 2 * threads
+        self.pending = deque()
+
+    def write(self, filename, text, done):
+        if self.is_pending(filename):
+            # 同じファイル名への書き込みは入力順に行う
+            self.wait()
+        path = os.path.join(self.output_dir, filename)
+        if self.executor is None:
+            with _profiler.stage('write', utf8_size(text)):
+                written = write_file_atomic(path, text)
+            done(written)
+            return
+        self.pending.append((filename, self.executor.submit(write_file_atomic, path, text), utf8_size(text), done))
+        while len(self.pending) > self.max_pending:
+            self._complete_oldest()
+
+    def is_pending(self, filename):
+        return any(pending_name == filename for pending_name, _, _, _ in self.pending)
+
+    def _complete_oldest(self):
+        _, future, size, done = self.pending[0]
+        with _profiler.stage('write', size):
+            written = future.result()
+        self.pending.popleft()
+        done(written)
+
+    def wait(self):
+        """Wait for all queued writes and run their callbacks"""
+        while self.pending:
+            self._complete_oldest()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+OUTPUT_BUFFER_SIZE = 1024 * 1024  # 1ファイルにまとめて出力する時の書き込みバッファ
+COMBINED_OUTPUT_NAME = 'conversations'  # 1ファイルにまとめた出力のファイル名（拡張子なし）
+
+class SingleFileOutput:
+    """Base class of the outputs that stream all conversations into one file
+
+    The file is written sequentially to a temporary file next to path and
+    renamed over path by close(), so an interrupted run leaves the previous
+    output in place.
+    """
+
+    extension = None
+    prefixed_anchors = False  # Trueなら会話ごとに異なる見出しのアンカーで変換する（1つのMarkdown文書にする形式）
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, f"{COMBINED_OUTPUT_NAME}.{self.extension}")
+        self.tmp_path = os.path.join(output_dir, f".{COMBINED_OUTPUT_NAME}.{self.extension}.{os.getpid()}.tmp")
+        self.file = open(self.tmp_path, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+        self.count = 0
+
+    def write(self, filename, text):
+        """Add the conversation rendered as text under its output filename"""
+        raise NotImplementedError
+
+    def search_target(self, filename):
+        """Return (file, anchor) of the conversation written as filename for the search index
+
+        file is relative to the output directory; an entry of an archive
+        or of JSON Lines is given as "conversations.zip:FILENAME".
+        """
+        return f"{os.path.basename(self.path)}:{filename}", ''
+
+    def finish(self):
+        """Write everything that follows the last conversation"""
+
+    def close(self):
+        try:
+            self.finish()
+            self.file.close()
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+ZIP_COMPRESS_LEVEL = 1  # 圧縮率より書き込みの速さを優先する（Markdownはレベル1でも十分に縮む）
+
+class ZipOutput(SingleFileOutput):
+    """All conversations as entries of one deflate-compressed zip archive"""
+
+    extension = 'zip'
+
+    def __init__(self, output_dir):
+        super().__init__(output_dir)
+        self.archive = zipfile.ZipFile(self.file, 'w')
+
+    def write(self, filename, text):
+        info = zipfile.ZipInfo(filename, date_time=time.localtime()[:6])
+        with warnings.catch_warnings():
+            # 同じファイル名の会話は展開時に後のものが優先される（ファイル出力と同じ）
+            warnings.simplefilter('ignore', UserWarning)
+            self.archive.writestr(info, encode_output(text), zipfile.ZIP_DEFLATED, ZIP_COMPRESS_LEVEL)
+        self.count += 1
+
+    def finish(self):
+        self.archive.close()
+
+class TarOutput(SingleFileOutput):
+    """All conversations as members of one uncompressed tar archive"""
+
+    extension = 'tar'
+
+    def __init__(self, output_dir):
+        super().__init__(output_dir)
+        self.archive = tarfile.open(fileobj=self.file, mode='w', format=tarfile.PAX_FORMAT)
+
+    def write(self, filename, text):
+        data = encode_output(text)
+        info = tarfile.TarInfo(filename)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.archive.addfile(info, io.BytesIO(data))
+        self.count += 1
+
+    def finish(self):
+        self.archive.close()
+
+class CombinedOutput(SingleFileOutput):
+    """Base class of the combined outputs that start with a table of contents
+
+    The table of contents is only known at the end, so the conversations are
+    first streamed to an anonymous temporary file and copied after it.
+    """
+
+    def __init__(self, output_dir):
+        super().__init__(output_dir)
+        self.body = tempfile.TemporaryFile(dir=output_dir, buffering=OUTPUT_BUFFER_SIZE)
+        self.entries = []  # [(filename, title)]
+
+    def write(self, filename, text):
+        newline = text.find('\n')
+        # 会話のMarkdownは"# タイトル"で始まる
+        title = (text if newline < 0 else text[:newline]).lstrip('#').strip()
+        self.entries.append((filename, title))
+        self.body.write(self.format_entry(filename, title, text))
+        self.count += 1
+
+    def finish(self):
+        self.file.write(self.format_toc())
+        self.body.seek(0)
+        shutil.copyfileobj(self.body, self.file, OUTPUT_BUFFER_SIZE)
+
+    def abort(self):
+        self.body.close()
+        super().abort()
+
+def combined_anchor(filename):
+    """Anchor of a conversation in the combined Markdown file"""
+    return os.path.splitext(filename)[0]
+
+class MarkdownOutput(CombinedOutput):
+    """All conversations in one Markdown file with a table of contents
+
+    The section anchors of each conversation are prefixed with its own
+    anchor, so that the links of its table of contents stay within it.
+    """
+
+    extension = 'md'
+    prefixed_anchors = True
+
+    def search_target(self, filename):
+        return os.path.basename(self.path), combined_anchor(filename)
+
+    def format_entry(self, filename, title, text):
+        return encode_output(f"<a id='{combined_anchor(filename)}'></a>\n\n{text}\n---\n\n")
+
+    def format_toc(self):
+        lines = ["# ChatGPT Conversations\n\n", "## Table of Contents\n\n"]
+        for i, (filename, title) in enumerate(self.entries, 1):
+            lines.append(f"{i}. [{title}](#{combined_anchor(filename)})\n")
+        lines.append("\n---\n\n")
+        return encode_output(''.join(lines))
+
+class JsonlOutput(CombinedOutput):
+    """All conversations in one JSON Lines file
+
+    The first line is {"toc": [{"filename": ..., "title": ...}, ...]},
+    followed by one {"filename": ..., "title": ..., "markdown": ...} per
+    conversation.
+    """
+
+    extension = 'jsonl'
+
+    def format_entry(self, filename, title, text):
+        record = {'filename': filename, 'title': title, 'markdown': text}
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def format_toc(self):
+        toc = [{'filename': filename, 'title': title} for filename, title in self.entries]
+        return (json.dumps({'toc': toc}, ensure_ascii=False) + '\n').encode('utf-8')
+
+# 出力形式（filesは会話ごとのMarkdownファイル）
+OUTPUT_FORMATS = {
+    'files': None,
+    'zip': ZipOutput,
+    'tar': TarOutput,
+    'md': MarkdownOutput,
+    'jsonl': JsonlOutput,
+}
+
+def process_json_file(input_file, output_dir='output', config_path='config.json', stream=True, jobs=1,
+                      incremental=True, debug=False, profiler=None, profile_report=None, search_index=False,
+                      writer_threads=DEFAULT_WRITER_THREADS, output_format='files', config=None, selection=None):
+    """Convert an export to Markdown files in output_dir and return the number of conversations converted
+
+    input_file: path of the export, or a list of paths of several exports,
+    which are merged so that each conversation is converted once (see
+    MergedExports; stream is ignored then).
+
+    Files are written atomically on writer_threads background threads (0:
+    in the calling thread), and left untouched if their content is the same.
+
+    output_format: 'files' for one Markdown file per conversation, or one of
+    the single-file formats of OUTPUT_FORMATS, which write every
+    conversation (incremental is ignored) into output_dir/conversations.*.
+
+    search_index: also build a full-text index of the messages in
+    output_dir (see search_export).
+    config: configuration already loaded with load_config, used instead of
+    reading config_path.
+    selection: ConversationSelection of the conversations to convert; they
+    are read through the offset index (see select_conversations).
+    profiler: Profiler to record stage timings with; its summary is printed
+    and, if profile_report is given, written there as JSON.
+    """
+    previous_profiler = set_profiler(profiler)
+    if profiler is not None:
+        profiler.start()
+    try:
+        return _process_json_file(input_file, output_dir, config_path, stream, jobs, incremental, debug,
+                                  search_index, writer_threads, output_format, config, selection)
+    finally:
+        set_profiler(previous_profiler)
+        if profiler is not None:
+            profiler.stop()
+            profiler.print_summary()
+            if profile_report:
+                profiler.write_report(profile_report)
+                print(f"Profile report written to {profile_report}")
+
+def _process_json_file(input_file, output_dir, config_path, stream, jobs, incremental, debug, search_index,
+                       writer_threads, output_format, config, selection):
+    os.makedirs(output_dir, exist_ok=True)
+    input_files = [input_file] if isinstance(input_file, (str, os.PathLike)) else list(input_file)
+    merged = None
+    if len(input_files) > 1:
+        with _profiler.stage('merge', sum(map(os.path.getsize, input_files)) if _profiler.enabled else 0):
+            merged = MergedExports(input_files)
+        print(f"Merged {len(input_files)} exports: {len(merged)} conversations "
+              f"({merged.duplicates} duplicates skipped)")
+        conversations = merged
+        if selection is not None:
+            conversations = (c for c in merged if selection.matches_conversation(c))
+        conversations = profiled_iter(conversations, 'load')
+    elif selection is not None:
+        conversations = profiled_iter(select_conversations(input_files[0], selection), 'load')
+    else:
+        conversations = profiled_iter(load_conversations(input_files[0], stream=stream), 'load',
+                                      os.path.getsize(input_files[0]) if _profiler.enabled else 0)
+    if config is None:
+        config = load_config(config_path)
+    single_output = OUTPUT_FORMATS[output_format]
+    # 1ファイルにまとめる場合は毎回すべての会話を出力する
+    incremental = incremental and single_output is None
+    manifest = ExportManifest(output_dir, config_fingerprint(config)) if incremental else None
+    index = None
+    if search_index:
+        try:
+            index = SearchIndex(os.path.join(output_dir, SEARCH_INDEX_FILENAME))
+        except SearchIndexUnavailable as e:
+            print(f"Warning: {str(e)}. Converting without the search index.")
+    skipped = 0
+    converted = 0
+    # 変換対象の会話の(id, update_time)を入力順に保持（結果も入力順に返る）
+    pending_ids = deque()
+
+    def changed_conversations():
+        nonlocal skipped
+        for conversation in conversations:
+            if (manifest is not None and manifest.is_unchanged(conversation)
+                    and (index is None or index.has(conversation.get('id')))):
+                skipped += 1
+                continue
+            pending_ids.append((conversation.get('id'), conversation.get('update_time', 0)))
+            yield conversation
+
+    cache_stats = {'hits': 0, 'misses': 0}
+    keyword_model = None
+    if config['features']['use_keyword_tags'] and config['keyword_settings'].get('mode') == 'corpus':
+        # エクスポート全体を先に形態素解析し、TF-IDFで会話ごとのキーワードを決める
+        corpus = merged if merged is not None else load_conversations(input_files[0], stream=stream)
+        if jobs > 1:
+            keyword_model = build_corpus_keywords(
+                map_parallel(_term_counts_one, corpus, config, jobs, cache_stats=cache_stats, debug=debug), config)
+        else:
+            cache = open_keyword_cache(config)
+            extractor = KeywordExtractor(config, debug=debug, cache=cache)
+            try:
+                keyword_model = build_corpus_keywords(
+                    (conversation_term_counts(c, config, extractor) for c in corpus), config)
+            finally:
+                if cache is not None:
+                    add_cache_stats(cache_stats, cache.stats())
+                    cache.close()
+    # 変換はconvert_conversationsに任せ、ここでは結果を入力順に書き出すだけにする
+    results = convert_conversations(changed_conversations(), config, jobs, extractor=keyword_model,
+                                    keyword_cache=True, include_messages=index is not None,
+                                    prefix_anchors=single_output is not None and single_output.prefixed_anchors,
+                                    cache_stats=cache_stats, debug=debug)
+
+    def written(filename, conversation_id, update_time):
+        # 書き込みの完了時に入力順に呼ばれる
+        def done(changed):
+            output_path = os.path.join(output_dir, filename)
+            print(f"Created: {output_path}" if changed else f"Identical: {output_path}")
+            if manifest is not None and conversation_id is not None:
+                stale = manifest.record(conversation_id, update_time, filename)
+                stale_path = os.path.join(output_dir, stale) if stale else None
+                if stale and not writer.is_pending(stale) and os.path.exists(stale_path):
+                    os.remove(stale_path)
+                    print(f"Removed: {stale_path}")
+        return done
+
+    try:
+        if single_output is not None:
+            output = single_output(output_dir)
+            try:
+                for filename, markdown, metadata, tags in results:
+                    pending_ids.popleft()
+                    converted += 1
+                    if index is not None:
+                        with _profiler.stage('index'):
+                            target, anchor = output.search_target(filename)
+                            index.add(target, search_rows(metadata, tags, anchor))
+                    with _profiler.stage('write', utf8_size(markdown)):
+                        output.write(filename, markdown)
+                    print(f"Added: {filename}")
+            except BaseException:
+                output.abort()
+                raise
+            with _profiler.stage('write'):
+                output.close()
+            print(f"Created: {output.path} ({output.count} conversations)")
+        else:
+            # ファイルの書き込みは書き込み用スレッドで変換と並行して行い、結果は入力順に処理する
+            # （同じファイル名になる会話があっても逐次実行時と同じ結果になる）
+            writer = OutputWriter(output_dir, writer_threads)
+            try:
+                for filename, markdown, metadata, tags in results:
+                    conversation_id, update_time = pending_ids.popleft()
+                    converted += 1
+                    if index is not None:
+                        with _profiler.stage('index'):
+                            index.add(filename, search_rows(metadata, tags))
+                    writer.write(filename, markdown, written(filename, conversation_id, update_time))
+            finally:
+                writer.close()
+    finally:
+        # 途中で終わった場合も変換を閉じ、キーワードキャッシュを書き込む
+        results.close()
+        if manifest is not None:
+            manifest.save()
+        if index is not None:
+            index.close()
+    if skipped:
+        print(f"Unchanged: {skipped} conversations skipped")
+    if cache_stats['hits'] + cache_stats['misses']:
+        print(format_cache_stats(cache_stats))
+    return converted
+
+DEFAULT_SERVE_ADDRESS = '127.0.0.1:8765'
+DEFAULT_MAX_JOBS = 2
+SERVICE_QUEUE_TIMEOUT = 60  # 同時実行数の上限に達している時にジョブが空きを待つ最大秒数
+SERVICE_IO_CHUNK_SIZE = 1024 * 1024
+
+# 1ファイルにまとめた出力を返す時のContent-Type
+OUTPUT_CONTENT_TYPES = {
+    'zip': 'application/zip',
+    'tar': 'application/x-tar',
+    'md': 'text/markdown; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+class ServiceBusy(Exception):
+    """Raised when a job could not get a slot within the queue timeout"""
+
+class ConversionService:
+    """Converts exports with a configuration and tokenizer loaded once
+
+    At most max_jobs conversions run at the same time; further jobs wait
+    up to queue_timeout seconds for a slot. The timings of the last jobs
+    are kept for the status endpoint.
+    """
+
+    def __init__(self, config_path='config.json', max_jobs=DEFAULT_MAX_JOBS, queue_timeout=SERVICE_QUEUE_TIMEOUT,
+                 work_dir=None):
+        self.config = load_config(config_path)
+        if self.config['features']['use_keyword_tags']:
+            # 辞書を先に読み込んでおき、最初のジョブでも待たせない
+            get_shared_tokenizer(self.config['tokenizer'].get('mmap', True))
+        self.max_jobs = max_jobs
+        self.queue_timeout = queue_timeout
+        self.work_dir = work_dir or tempfile.gettempdir()
+        self.slots = threading.BoundedSemaphore(max_jobs)
+        self.lock = threading.Lock()
+        self.job_ids = itertools.count(1)
+        self.running = 0
+        self.completed = 0
+        self.recent = deque(maxlen=100)
+
+    def new_job(self, source, output_format):
+        """Return the record of a new job; its timings are filled in by convert()"""
+        return {'id': next(self.job_ids), 'source': source, 'format': output_format,
+                'status': 'queued', 'timing': {}}
+
+    def convert(self, job, input_file, output_dir, timeout=None):
+        """Convert input_file into output_dir in job['format'] and return the number of conversations
+
+        Raises ServiceBusy if no slot is free within timeout seconds
+        (None: wait indefinitely).
+        """
+        start = time.perf_counter()
+        if not self.slots.acquire(timeout=timeout):
+            job['status'] = 'rejected'
+            raise ServiceBusy(f"{self.max_jobs} jobs are already running")
+        started = time.perf_counter()
+        with self.lock:
+            self.running += 1
+        job['status'] = 'running'
+        try:
+            count = process_json_file(input_file, output_dir, config=self.config, incremental=False,
+                                      output_format=job['format'])
+            job['conversations'] = count
+            job['status'] = 'done'
+            return count
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            raise
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.slots.release()
+            job['timing']['queue'] = round(started - start, 6)
+            job['timing']['convert'] = round(time.perf_counter() - started, 6)
+
+    def finish(self, job):
+        """Record a finished job and log its timings"""
+        with self.lock:
+            self.completed += 1
+            self.recent.append(job)
+        timing = ', '.join(f"{stage} {seconds:.3f}s" for stage, seconds in job['timing'].items())
+        print(f"Job {job['id']} ({job['source']}, {job['format']}): {job['status']}"
+              + (f", {job['conversations']} conversations" if 'conversations' in job else '')
+              + (f" [{timing}]" if timing else ''))
+
+    def status(self):
+        with self.lock:
+            return {'running': self.running, 'max_jobs': self.max_jobs, 'completed': self.completed,
+                    'recent': list(self.recent)}
+
+# HTTPサーバーのモジュールはサービスとして起動した時だけ読み込む（通常の変換の起動を遅くしないため）
+_HTTP_SERVER_CLASSES = ('ConversionRequestHandler', 'ConversionHTTPServer', 'UnixConversionHTTPServer')
+
+@functools.lru_cache(maxsize=None)
+def http_server_classes():
+    """Import http.server and return the service's HTTP classes by name
+
+    UnixConversionHTTPServer is None where Unix sockets are not supported.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import socket
+    import socketserver
+
+    class ConversionRequestHandler(BaseHTTPRequestHandler):
+        """HTTP API of ConversionService
+
+        POST /convert?format=zip|tar|md|jsonl  body: conversations.json
+            -> the converted export as one file (timings in X-Json2md-Timing)
+        GET /status -> running and recent jobs as JSON
+        """
+
+        server_version = 'json2md'
+        # HTTP/1.1ならExpect: 100-continueに応答する（curlなどは大きな本文の前に待たない）
+        # すべての応答にContent-Lengthを付けているので接続を使い回せる
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if urllib.parse.urlsplit(self.path).path != '/status':
+                self.send_json(404, {'error': 'not found'})
+                return
+            self.send_json(200, self.server.service.status())
+
+        def do_POST(self):
+            url = urllib.parse.urlsplit(self.path)
+            # 本文を読まずに応答する場合は、残った本文を次のリクエストとして読まないよう接続を閉じる
+            if url.path != '/convert':
+                self.send_json(404, {'error': 'not found'}, {'Connection': 'close'})
+                return
+            output_format = urllib.parse.parse_qs(url.query).get('format', ['zip'])[0]
+            if output_format not in OUTPUT_CONTENT_TYPES:
+                self.send_json(400, {'error': f"format must be one of {', '.join(OUTPUT_CONTENT_TYPES)}"},
+                               {'Connection': 'close'})
+                return
+            try:
+                length = int(self.headers['Content-Length'])
+            except (TypeError, ValueError):
+                self.send_json(411, {'error': 'Content-Length is required'}, {'Connection': 'close'})
+                return
+            service = self.server.service
+            job = service.new_job(f"http {self.address_string()}", output_format)
+            job_dir = tempfile.mkdtemp(prefix='json2md-job-', dir=service.work_dir)
+            try:
+                start = time.perf_counter()
+                input_file = os.path.join(job_dir, 'conversations.json')
+                with open(input_file, 'wb') as f:
+                    remaining = length
+                    while remaining > 0:
+                        data = self.rfile.read(min(remaining, SERVICE_IO_CHUNK_SIZE))
+                        if not data:
+                            break
+                        f.write(data)
+                        remaining -= len(data)
+                job['timing']['receive'] = round(time.perf_counter() - start, 6)
+                output_dir = os.path.join(job_dir, 'output')
+                try:
+                    service.convert(job, input_file, output_dir, timeout=service.queue_timeout)
+                except ServiceBusy as e:
+                    self.send_json(503, {'error': str(e)}, {'Retry-After': '5'})
+                    return
+                except Exception as e:
+                    self.send_json(500, {'error': str(e)})
+                    return
+                start = time.perf_counter()
+                output_path = os.path.join(output_dir, f"{COMBINED_OUTPUT_NAME}.{output_format}")
+                self.send_response(200)
+                self.send_header('Content-Type', OUTPUT_CONTENT_TYPES[output_format])
+                self.send_header('Content-Length', str(os.path.getsize(output_path)))
+                self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(output_path)}"')
+                self.send_header('X-Json2md-Job', str(job['id']))
+                self.send_header('X-Json2md-Timing', json.dumps(job['timing']))
+                self.end_headers()
+                with open(output_path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile, SERVICE_IO_CHUNK_SIZE)
+                job['timing']['send'] = round(time.perf_counter() - start, 6)
+            finally:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                service.finish(job)
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            # Unixソケットではクライアントのアドレスがない
+            return self.client_address[0] if self.client_address else 'unix'
+
+    class ConversionHTTPServer(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def __init__(self, address, service):
+            super().__init__(address, ConversionRequestHandler)
+            self.service = service
+
+    if hasattr(socket, 'AF_UNIX'):
+        class UnixConversionHTTPServer(ConversionHTTPServer):
+            address_family = socket.AF_UNIX
+
+            def server_bind(self):
+                if os.path.exists(self.server_address):
+                    os.remove(self.server_address)
+                socketserver.TCPServer.server_bind(self)
+                self.server_name = 'localhost'
+                self.server_port = 0
+    else:
+        UnixConversionHTTPServer = None
+    return {'ConversionRequestHandler': ConversionRequestHandler,
+            'ConversionHTTPServer': ConversionHTTPServer,
+            'UnixConversionHTTPServer': UnixConversionHTTPServer}
+
+def __getattr__(name):
+    # json2md.ConversionHTTPServerなどはアクセスされた時に読み込む
+    if name in _HTTP_SERVER_CLASSES:
+        return http_server_classes()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def make_server(address, service):
+    """Create the HTTP server for address: "HOST:PORT", "PORT" or "unix:PATH" (port 0: any free port)"""
+    classes = http_server_classes()
+    if address.startswith('unix:'):
+        if classes['UnixConversionHTTPServer'] is None:
+            raise ValueError('Unix sockets are not supported on this platform')
+        return classes['UnixConversionHTTPServer'](address[len('unix:'):], service)
+    host, _, port = address.rpartition(':')
+    return classes['ConversionHTTPServer']((host or '127.0.0.1', int(port)), service)
+
+def watch_inbox(service, inbox, outbox, output_format='files', poll_interval=1.0, stop=None):
+    """Convert the .json files put into inbox until stop (a threading.Event) is set
+
+    A file is taken once its size has not changed for one poll interval; it
+    is moved to inbox/processing while converting and to inbox/done (or
+    inbox/failed) afterwards. The result is written to outbox/NAME/ for the
+    files format, or outbox/NAME.FORMAT, with the timings in
+    outbox/NAME.job.json.
+    """
+    for name in ('processing', 'done', 'failed'):
+        os.makedirs(os.path.join(inbox, name), exist_ok=True)
+    os.makedirs(outbox, exist_ok=True)
+    sizes = {}
+    slots = ThreadPoolExecutor(max_workers=service.max_jobs)
+    try:
+        while stop is None or not stop.is_set():
+            current = {}
+            for entry in os.scandir(inbox):
+                if entry.is_file() and entry.name.endswith('.json'):
+                    current[entry.name] = entry.stat().st_size
+            for name, size in list(current.items()):
+                if sizes.get(name) != size:
+                    continue  # まだ書き込み中の可能性がある
+                processing = os.path.join(inbox, 'processing', name)
+                try:
+                    os.replace(os.path.join(inbox, name), processing)
+                except OSError:
+                    continue
+                del current[name]
+                slots.submit(_run_inbox_job, service, inbox, outbox, name, output_format)
+            sizes = current
+            if stop is None:
+                time.sleep(poll_interval)
+            else:
+                stop.wait(poll_interval)
+    finally:
+        slots.shutdown()
+
+def _run_inbox_job(service, inbox, outbox, name, output_format):
+    stem = os.path.splitext(name)[0]
+    processing = os.path.join(inbox, 'processing', name)
+    job = service.new_job(f"inbox {name}", output_format)
+    job_dir = tempfile.mkdtemp(prefix='json2md-job-', dir=outbox)
+    try:
+        service.convert(job, processing, job_dir)
+        start = time.perf_counter()
+        if output_format == 'files':
+            target = os.path.join(outbox, stem)
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(job_dir, target)
+        else:
+            os.replace(os.path.join(job_dir, f"{COMBINED_OUTPUT_NAME}.{output_format}"),
+                       os.path.join(outbox, f"{stem}.{output_format}"))
+        job['timing']['deliver'] = round(time.perf_counter() - start, 6)
+        os.replace(processing, os.path.join(inbox, 'done', name))
+    except Exception as e:
+        print(f"Error: job {job['id']} ({name}) failed: {e}")
+        if os.path.exists(processing):
+            os.replace(processing, os.path.join(inbox, 'failed', name))
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        service.finish(job)
+        with open(os.path.join(outbox, f"{stem}.job.json"), 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False, indent=1)
+
+def serve(config_path, address=None, inbox=None, outbox=None, output_format='files', max_jobs=DEFAULT_MAX_JOBS):
+    """Run the conversion service on address and/or inbox until interrupted"""
+    service = ConversionService(config_path, max_jobs=max_jobs)
+    stop = threading.Event()
+    watcher = None
+    if inbox:
+        outbox = outbox or os.path.join(inbox, 'outbox')
+        watcher = threading.Thread(target=watch_inbox, args=(service, inbox, outbox, output_format),
+                                   kwargs={'stop': stop}, daemon=True)
+        watcher.start()
+        print(f"Watching {inbox} (results in {outbox})")
+    try:
+        if address:
+            with make_server(address, service) as server:
+                if isinstance(server.server_address, tuple):
+                    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}/")
+                else:
+                    print(f"Serving on {address}")
+                server.serve_forever()
+        elif watcher is not None:
+            while watcher.is_alive():
+                watcher.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if watcher is not None:
+            watcher.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert ChatGPT conversations.json to Markdown files')
+    parser.add_argument('input_files', nargs='*', default=['conversations.json'], metavar='input_file',
+                        help='ChatGPT export file (default: conversations.json); several exports are merged '
+                             'and each conversation is converted once, from the copy with the newest update_time')
+    parser.add_argument('-o', '--output-dir', default='output',
+                        help='output directory (default: output)')
+    parser.add_argument('-c', '--config', default='config.json',
+                        help='configuration file (default: config.json)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes (default: 1)')
+    parser.add_argument('--force', action='store_true',
+                        help='re-export every conversation even if it is unchanged since the last run')
+    parser.add_argument('--no-stream', action='store_true',
+                        help='load the whole export with json.load instead of streaming it')
+    parser.add_argument('--debug', action='store_true',
+                        help='print keyword extraction debug output')
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), default='files',
+                        help='files: one Markdown file per conversation (default); zip/tar: one archive; '
+                             f'md/jsonl: one combined file with a table of contents ({COMBINED_OUTPUT_NAME}.* '
+                             'in the output directory)')
+    parser.add_argument('--writer-threads', type=int, default=DEFAULT_WRITER_THREADS, metavar='N',
+                        help='threads writing output files in the background, 0 to write synchronously '
+                             f'(default: {DEFAULT_WRITER_THREADS})')
+    parser.add_argument('--id', action='append', dest='ids', metavar='ID',
+                        help='convert only the conversation with this id (can be repeated)')
+    parser.add_argument('--since', metavar='DATE',
+                        help='convert only conversations created at or after DATE (ISO format, local time)')
+    parser.add_argument('--until', metavar='DATE',
+                        help='convert only conversations created before DATE, or on DATE if it has no time')
+    parser.add_argument('--title', metavar='REGEX',
+                        help='convert only conversations whose title matches REGEX')
+    parser.add_argument('--index', action='store_true',
+                        help=f'also build a full-text search index ({SEARCH_INDEX_FILENAME}) in the output directory')
+    parser.add_argument('--search', metavar='QUERY',
+                        help='search the index in the output directory instead of converting')
+    parser.add_argument('--limit', type=int, default=20,
+                        help='maximum number of search results (default: 20)')
+    parser.add_argument('--serve', nargs='?', const=DEFAULT_SERVE_ADDRESS, metavar='ADDRESS',
+                        help='run as a conversion service with the config and tokenizer kept loaded, '
+                             'serving POST /convert and GET /status on HOST:PORT or unix:PATH '
+                             f'(default: {DEFAULT_SERVE_ADDRESS})')
+    parser.add_argument('--inbox', metavar='DIR',
+                        help='run as a conversion service converting the .json files put into DIR')
+    parser.add_argument('--outbox', metavar='DIR',
+                        help='directory for the results of --inbox (default: DIR/outbox)')
+    parser.add_argument('--max-jobs', type=int, default=DEFAULT_MAX_JOBS, metavar='N',
+                        help=f'maximum number of concurrent service jobs (default: {DEFAULT_MAX_JOBS})')
+    parser.add_argument('--profile', nargs='?', const='json2md-profile.json', metavar='REPORT',
+                        help='record stage timings, print a summary and write a JSON report '
+                             '(default: json2md-profile.json)')
+    parser.add_argument('--profile-top', type=int, default=10, metavar='N',
+                        help='number of slowest conversations to report (default: 10)')
+    parser.add_argument('--cprofile', action='store_true',
+                        help='with --profile, also capture cProfile data of the main process (REPORT.prof)')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='with --profile, also record peak memory with tracemalloc')
+    args = parser.parse_args(argv)
+    if args.search is not None:
+        try:
+            results = search_export(args.output_dir, args.search, args.limit)
+        except (FileNotFoundError, SearchIndexUnavailable) as e:
+            sys.exit(f"Error: {str(e)}")
+        for result in results:
+            path = os.path.join(args.output_dir, result['filename'])
+            title = WHITESPACE_RE.sub(' ', result['title'])
+            print(f"{path}{result['anchor']}\t{title}\t{result['snippet']}")
+        return
+    if args.serve or args.inbox:
+        serve(args.config, args.serve, args.inbox, args.outbox, args.format, max(1, args.max_jobs))
+        return
+    profiler = None
+    if args.profile:
+        profiler = Profiler(top_n=args.profile_top, cprofile=args.cprofile, trace_memory=args.tracemalloc)
+    selection = None
+    if args.ids or args.since or args.until or args.title:
+        try:
+            selection = ConversationSelection(args.ids,
+                                              parse_time(args.since) if args.since else None,
+                                              parse_time(args.until, end_of_day=True) if args.until else None,
+                                              args.title)
+        except (ValueError, re.error) as e:
+            parser.error(str(e))
+    process_json_file(args.input_files, args.output_dir, args.config,
+                      stream=not args.no_stream, jobs=max(1, args.jobs),
+                      incremental=not args.force, debug=args.debug,
+                      profiler=profiler, profile_report=args.profile, search_index=args.index,
+                      writer_threads=max(0, args.writer_threads), output_format=args.format,
+                      selection=selection)
 
 if __name__ == "__main__":
-    input_file = "conversations.json"
-    process_json_file(input_file) 
\ No newline at end of file
+    multiprocessing.freeze_support()
+    main()